@@ -1,4 +1,5 @@
 import random
+from time import time
 from games import TicTacToe, Gomoku
 
 
@@ -27,18 +28,13 @@ class RandomPlayer(Player):
 class MyPlayer(Player):
     def choose_move(self, game, state):
         def terminal(game, state):
-            for move in game.actions(state):
+            # game can be finished only next to some stone, so candidate moves are enough
+            for move in game.candidate_moves(state):
                 next_state = game.state_after_move(state, move)
                 if game.is_terminal(next_state):
                     return move
             return None
 
-        def copy_dict(d):
-            result = dict()
-            for key in d:
-                result[key] = d[key]
-            return result
-
         def closest(game, state):
             my_icon = game.player_at_turn(state)
             board = game.board_in_state(state)
@@ -53,15 +49,13 @@ class MyPlayer(Player):
                                 closest = [d, move]
             return closest[1]
 
-        board = state["board"]
-        my_icon = game.player_at_turn(state)
+        board = game.board_in_state(state)
 # if I can finish the game I ll do it
         t = terminal(game, state)
         if t is not None:
             return t
 # If opponent can finish the game I ll block him/her/it
-        opponent_state = copy_dict(state)
-        opponent_state["player_on_turn"] = game.other_player(my_icon)
+        opponent_state = game.switch_player(state)
 
         t = terminal(game, opponent_state)
         if t is not None:
@@ -79,6 +73,505 @@ class MyPlayer(Player):
         return game.actions(state)[0]
 
 
+def board_windows(game):
+    # All lines of k fields (windows) of the board of game as lists of field indices, and list of
+    # indices of windows through every field
+    windows = []
+    cell_windows = [[] for _ in range(game.h * game.w)]
+    for r in range(game.h):
+        for c in range(game.w):
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                if 0 <= r + (game.k - 1) * dr < game.h and 0 <= c + (game.k - 1) * dc < game.w:
+                    window = [game.rc_to_idx(r + i * dr, c + i * dc) for i in range(game.k)]
+                    for cell in window:
+                        cell_windows[cell].append(len(windows))
+                    windows.append(window)
+    return windows, cell_windows
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class ThreatPlayer(Player):
+    # Gomoku player based on threat-space search. It keeps a table of all lines of k fields
+    # (windows) with number of stones of both players in each of them. A window with stones of
+    # only one player is a threat of that player: k-1 stones is a four (one move to win), k-2
+    # stones a three. The table is updated incrementally by place/remove, which touch only windows
+    # through the changed field. Search looks for victory by continuous fours (VCF - opponent has
+    # to block every four) and by threats (VCT - threes too) of both players, to win or to defend
+    # in time, limited by time_limit seconds per move. Otherwise the move is chosen by score of
+    # threats it makes and blocks.
+    def __init__(self, time_limit=1.0, vcf_depth=12, vct_depth=4):
+        self.time_limit = time_limit
+        self.vcf_depth = vcf_depth  # max number of own fours in VCF
+        self.vct_depth = vct_depth  # max number of own threes in VCT
+        self.dims = None
+        self.deadline = None
+        self.nodes = 0
+
+    def setup(self, game):
+        # windows of the board and windows through every field
+        self.dims = (game.h, game.w, game.k)
+        self.k = game.k
+        self.min_line = max(1, game.k - 3)  # windows with fewer stones are not tracked
+        p0, p1 = game.players()
+        self.other = {p0: p1, p1: p0}
+        self.windows, self.cell_windows = board_windows(game)
+        self.reset()
+
+    def reset(self):
+        self.cells = [' '] * len(self.cell_windows)
+        self.counts = {p: [0] * len(self.windows) for p in self.other}
+        # lines[player][n] - windows with n stones of player and none of his opponent
+        self.lines = {p: {n: set() for n in range(self.min_line, self.k + 1)} for p in self.other}
+
+    def sync(self, game, state):
+        # Update the table to the board of state (normally just stones added since the last move)
+        if self.dims != (game.h, game.w, game.k):
+            self.setup(game)
+        board = game.board_in_state(state)
+        for cell, stone in enumerate(self.cells):
+            r, c = game.idx_to_rc(cell)
+            if board[r][c] != stone:
+                if stone != ' ':
+                    self.reset()
+                    return self.sync(game, state)
+                self.place(cell, board[r][c])
+
+    def place(self, cell, p):
+        o = self.other[p]
+        own, opp = self.counts[p], self.counts[o]
+        self.cells[cell] = p
+        for w in self.cell_windows[cell]:
+            a, b = own[w], opp[w]
+            own[w] = a + 1
+            if b == 0:
+                if a >= self.min_line:
+                    self.lines[p][a].discard(w)
+                if a + 1 >= self.min_line:
+                    self.lines[p][a + 1].add(w)
+            elif a == 0 and b >= self.min_line:
+                self.lines[o][b].discard(w)
+
+    def remove(self, cell, p):
+        o = self.other[p]
+        own, opp = self.counts[p], self.counts[o]
+        self.cells[cell] = ' '
+        for w in self.cell_windows[cell]:
+            a, b = own[w] - 1, opp[w]
+            own[w] = a
+            if b == 0:
+                if a + 1 >= self.min_line:
+                    self.lines[p][a + 1].discard(w)
+                if a >= self.min_line:
+                    self.lines[p][a].add(w)
+            elif a == 0 and b >= self.min_line:
+                self.lines[o][b].add(w)
+
+    def empties(self, windows):
+        # set of empty fields in given windows
+        cells = self.cells
+        return {cell for w in windows for cell in self.windows[w] if cells[cell] == ' '}
+
+    def check_time(self):
+        self.nodes += 1
+        if self.nodes % 256 == 0 and time() > self.deadline:
+            raise SearchTimeout()
+
+    def vcf(self, p, depth):
+        # Move of p (at turn) which starts victory by continuous fours, or None
+        self.check_time()
+        k, o = self.k, self.other[p]
+        wins = self.empties(self.lines[p][k - 1])
+        if wins:
+            return min(wins)
+        blocks = self.empties(self.lines[o][k - 1])
+        if depth == 0 or len(blocks) > 1:
+            return None
+        for cell in sorted(self.empties(self.lines[p][k - 2])):
+            if blocks and cell not in blocks:
+                continue  # opponent`s four has to be blocked, by a four
+            self.place(cell, p)
+            replies = self.empties(self.lines[p][k - 1])
+            win = len(replies) > 1
+            if not win:
+                reply = replies.pop()
+                self.place(reply, o)
+                win = not self.lines[o][k] and self.vcf(p, depth - 1) is not None
+                self.remove(reply, o)
+            self.remove(cell, p)
+            if win:
+                return cell
+        return None
+
+    def vct(self, p, depth):
+        # Move of p (at turn) which starts victory by threats (fours and threes), or None.
+        # Three counts as a threat only if it makes at least two windows with k-2 stones (open
+        # three); opponent may answer it in any of these windows or by his own four.
+        move = self.vcf(p, self.vcf_depth)
+        k, o = self.k, self.other[p]
+        if move is not None or depth == 0 or k - 3 < self.min_line or self.lines[o][k - 1]:
+            return move
+        threes = self.lines[p][k - 3]
+        for cell in sorted(self.empties(threes)):
+            made = [w for w in self.cell_windows[cell] if w in threes]
+            if len(made) < 2:
+                continue
+            self.place(cell, p)
+            replies = self.empties(made) | self.empties(self.lines[p][k - 1]) | self.empties(self.lines[o][k - 2])
+            win = True
+            for reply in sorted(replies):
+                self.place(reply, o)
+                win = not self.lines[o][k] and self.vct(p, depth - 1) is not None
+                self.remove(reply, o)
+                if not win:
+                    break
+            self.remove(cell, p)
+            if win:
+                return cell
+        return None
+
+    def defend(self, p, threat):
+        # Move of p after which threat (search of opponent`s victory) finds nothing, or None.
+        # Tried are fields of opponent`s threats and own fours, best scoring first.
+        o, k = self.other[p], self.k
+        lines = self.lines[o]
+        cells = self.empties(set().union(*(lines[n] for n in range(self.min_line, k) if n >= k - 3)))
+        cells |= self.empties(self.lines[p][k - 2])
+        for cell in sorted(cells, key=lambda cell: -self.score(cell, p)):
+            self.place(cell, p)
+            safe = threat(o) is None
+            self.remove(cell, p)
+            if safe:
+                return cell
+        return None
+
+    def search(self, p):
+        k, o = self.k, self.other[p]
+        wins = self.empties(self.lines[p][k - 1])
+        if wins:
+            return min(wins)
+        blocks = self.empties(self.lines[o][k - 1])
+        if blocks:
+            return max(blocks, key=lambda cell: self.score(cell, p))
+        move = self.vcf(p, self.vcf_depth)
+        if move is not None:
+            return move
+        vcf = lambda player: self.vcf(player, self.vcf_depth)
+        if vcf(o) is not None:
+            return self.defend(p, vcf)
+        for depth in range(1, self.vct_depth + 1):
+            move = self.vct(p, depth)
+            if move is not None:
+                return move
+        vct = lambda player: self.vct(player, self.vct_depth)
+        if vct(o) is not None:
+            return self.defend(p, vct)
+        return None
+
+    def score(self, cell, p):
+        # How much placing stone of p to cell helps p (stones in windows it extends) and how much
+        # it blocks the opponent
+        own, opp = self.counts[p], self.counts[self.other[p]]
+        s = 0
+        for w in self.cell_windows[cell]:
+            if opp[w] == 0:
+                s += 6 ** own[w]
+            if own[w] == 0:
+                s += 5 ** opp[w]
+        return s
+
+    def choose_move(self, game, state):
+        self.deadline = time() + self.time_limit
+        self.sync(game, state)
+        p = game.player_at_turn(state)
+        move = None
+        try:
+            move = self.search(p)
+        except SearchTimeout:
+            # search was interrupted between place and remove, table is built again
+            self.reset()
+            self.sync(game, state)
+        if move is None:
+            free = [cell for cell, stone in enumerate(self.cells) if stone == ' ']
+            move = max(free, key=lambda cell: self.score(cell, p))
+        return move
+
+
+EXACT, LOWER, UPPER = 0, 1, 2  # kinds of values in transposition table
+
+
+class AlphaBetaPlayer(Player):
+    # Alpha-beta (negamax) search for TicTacToe(h, w, k) with any h, w, k. Search uses its own
+    # representation of the board - stone counts of both players in every window (see
+    # board_windows), which give both win detection and evaluation incrementally. Searched
+    # positions are stored in transposition table under Zobrist hash; positions symmetric to each
+    # other (rotations and reflections of the board, rotations only if h == w) share one entry.
+    # Small boards (up to 25 fields) are searched with all moves, so they are solved exactly,
+    # bigger ones only with moves at most d fields from some stone. Iterative deepening stops
+    # when the position is solved or time_limit seconds per move are used; on small boards it
+    # gives way to a search to the end of game once a quarter of the time is used.
+    WIN = 10 ** 7  # value of won game, plus number of empty fields left (faster win is better)
+
+    def __init__(self, time_limit=1.0, max_depth=None, d=1, tt_size=1 << 20, seed=2021):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.d = d
+        self.tt_size = tt_size
+        self.seed = seed
+        self.dims = None
+        self.tt = {}
+        self.nodes = 0
+        self.deadline = None
+        self.value = None  # value of the last chosen move
+
+    def setup(self, game):
+        h, w, k = self.dims = (game.h, game.w, game.k)
+        self.k = k
+        self.fields = h * w
+        self.windows, self.cell_windows = board_windows(game)
+        self.weights = [4 ** n for n in range(k)] + [0]
+        self.weights[0] = 0
+        self.full_width = self.fields <= 25
+        self.neighbours = []
+        for cell in range(self.fields):
+            r, c = game.idx_to_rc(cell)
+            mask = 0
+            for rr in range(max(0, r - self.d), min(h, r + self.d + 1)):
+                for cc in range(max(0, c - self.d), min(w, c + self.d + 1)):
+                    mask |= 1 << game.rc_to_idx(rr, cc)
+            self.neighbours.append(mask)
+        # symmetries of the board as permutations of fields
+        self.perms = []
+        for transpose in ((False, True) if h == w else (False,)):
+            for flip_r in (False, True):
+                for flip_c in (False, True):
+                    perm = []
+                    for cell in range(self.fields):
+                        r, c = game.idx_to_rc(cell)
+                        if transpose:
+                            r, c = c, r
+                        if flip_r:
+                            r = h - 1 - r
+                        if flip_c:
+                            c = w - 1 - c
+                        perm.append(game.rc_to_idx(r, c))
+                    self.perms.append(perm)
+        self.inverse = []
+        for perm in self.perms:
+            inverse = [0] * self.fields
+            for cell, image in enumerate(perm):
+                inverse[image] = cell
+            self.inverse.append(inverse)
+        # keys[i][cell] - Zobrist keys of stone of player i on cell, one for every symmetry
+        rnd = random.Random(self.seed)
+        zobrist = [[rnd.getrandbits(64) for _ in range(self.fields)] for _ in range(2)]
+        self.keys = [[[zobrist[i][perm[cell]] for perm in self.perms] for cell in range(self.fields)]
+                     for i in range(2)]
+        self.tt = {}
+        self.history = [0] * self.fields
+
+    def load(self, game, state):
+        # Set up search state from state of the game
+        if self.dims != (game.h, game.w, game.k):
+            self.setup(game)
+        if len(self.tt) > self.tt_size:
+            self.tt.clear()
+        self.counts = [[0] * len(self.windows) for _ in range(2)]
+        self.score = 0  # evaluation for the first player
+        self.live = len(self.windows)  # windows which are not blocked by both players
+        self.empty = self.fields
+        self.free = (1 << self.fields) - 1
+        self.near = 0
+        self.hashes = [0] * len(self.perms)
+        self.stack = []
+        board = game.board_in_state(state)
+        players = game.players()
+        for cell in range(self.fields):
+            r, c = game.idx_to_rc(cell)
+            if board[r][c] != ' ':
+                self.place(cell, players.index(board[r][c]))
+        self.stack = []
+
+    def place(self, cell, i):
+        # Put stone of player i to cell, returns True if he won by it
+        self.stack.append((self.score, self.live, self.free, self.near, self.hashes))
+        own, opp = self.counts[i], self.counts[1 - i]
+        weights = self.weights
+        won = False
+        delta = 0
+        for w in self.cell_windows[cell]:
+            a, b = own[w], opp[w]
+            own[w] = a + 1
+            if b == 0:
+                delta += weights[a + 1] - weights[a]
+                won = won or a + 1 == self.k
+            elif a == 0:
+                delta += weights[b]  # opponent`s window is blocked
+                self.live -= 1
+        self.score += delta if i == 0 else -delta
+        self.empty -= 1
+        self.free &= ~(1 << cell)
+        self.near = (self.near | self.neighbours[cell]) & self.free
+        self.hashes = [h ^ key for h, key in zip(self.hashes, self.keys[i][cell])]
+        return won
+
+    def remove(self, cell, i):
+        own = self.counts[i]
+        for w in self.cell_windows[cell]:
+            own[w] -= 1
+        self.empty += 1
+        self.score, self.live, self.free, self.near, self.hashes = self.stack.pop()
+
+    def gain(self, cell, i):
+        # How much stone of player i on cell adds to his own windows and blocks opponent`s ones
+        own, opp = self.counts[i], self.counts[1 - i]
+        weights = self.weights
+        gain = 0
+        for w in self.cell_windows[cell]:
+            a, b = own[w], opp[w]
+            if b == 0:
+                gain += weights[a + 1] - weights[a]
+            elif a == 0:
+                gain += weights[b]
+        return gain
+
+    def moves(self, first, i):
+        # Fields to search, first (hash move) first, then the others by gain and history of cutoffs
+        mask = self.free if self.full_width or not self.near else self.near
+        cells = []
+        while mask:
+            low = mask & -mask
+            cells.append(low.bit_length() - 1)
+            mask ^= low
+        cells.sort(key=lambda cell: (-self.gain(cell, i), -self.history[cell]))
+        if first is not None and first in cells:
+            cells.remove(first)
+            cells.insert(0, first)
+        return cells
+
+    def tactics(self, i):
+        # Scan of all windows on small board. Returns (value, forced moves, can player i win,
+        # can his opponent win): value is known if player i wins by his next move or loses
+        # because opponent has two threats, forced is opponent`s threat which has to be blocked.
+        # Player can win only if some window has no opponent`s stones and he has enough moves
+        # left to fill it.
+        k, empty, free = self.k, self.empty, self.free
+        own, opp = self.counts[i], self.counts[1 - i]
+        own_moves, opp_moves = (empty + 1) // 2, empty // 2
+        own_alive = opp_alive = False
+        blocks = set()
+        for w, cells in enumerate(self.windows):
+            a, b = own[w], opp[w]
+            if b == 0:
+                if a == k - 1:
+                    return self.WIN + empty - 1, None, True, opp_alive
+                own_alive = own_alive or k - a <= own_moves
+            if a == 0:
+                if b == k - 1:
+                    blocks.update(cell for cell in cells if free >> cell & 1)
+                opp_alive = opp_alive or k - b <= opp_moves
+        if len(blocks) > 1:
+            return -(self.WIN + empty - 2), None, own_alive, True
+        return None, list(blocks) or None, own_alive, opp_alive
+
+    def negamax(self, depth, alpha, beta, i):
+        # Value of the position for player i at turn, searched depth moves deep
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time() > self.deadline:
+            raise SearchTimeout()
+        if self.empty == 0 or self.live == 0:
+            return 0  # full board, or nobody can win any more
+        depth = min(depth, self.empty)  # deeper search than to the end of game is exact too
+        if depth == 0:
+            return self.score if i == 0 else -self.score
+        forced = None
+        if self.full_width:
+            value, forced, own_alive, opp_alive = self.tactics(i)
+            if value is not None:
+                return value
+            # value is at most 0 if player i can`t win, at least 0 if his opponent can`t
+            if not own_alive and (not opp_alive or alpha >= 0):
+                return 0
+            if not opp_alive and beta <= 0:
+                return 0
+        key = min(self.hashes)
+        s = self.hashes.index(key)
+        entry = self.tt.get(key)
+        first = None
+        alpha0 = alpha
+        if entry is not None:
+            e_depth, kind, value, move = entry
+            first = self.inverse[s][move]
+            if e_depth >= depth:
+                if kind == EXACT:
+                    return value
+                if kind == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+        best, best_move = -2 * self.WIN, None
+        for move in forced or self.moves(first, i):
+            if self.place(move, i):
+                value = self.WIN + self.empty
+            else:
+                value = -self.negamax(depth - 1, -beta, -alpha, 1 - i)
+            self.remove(move, i)
+            if value > best:
+                best, best_move = value, move
+                if best > alpha:
+                    alpha = best
+                    if alpha >= beta:
+                        self.history[move] += depth * depth
+                        break
+        kind = UPPER if best <= alpha0 else LOWER if best >= beta else EXACT
+        self.tt[key] = (depth, kind, best, self.perms[s][best_move])
+        return best
+
+    def search_root(self, depth, i, first):
+        # (value, best move) of the searched position for player i at turn
+        alpha, beta = -2 * self.WIN, 2 * self.WIN
+        best_move = None
+        for move in self.moves(first, i):
+            if self.place(move, i):
+                value = self.WIN + self.empty
+            else:
+                value = -self.negamax(depth - 1, -beta, -alpha, 1 - i)
+            self.remove(move, i)
+            if best_move is None or value > alpha:
+                alpha, best_move = value, move
+        return alpha, best_move
+
+    def choose_move(self, game, state):
+        self.deadline = time() + self.time_limit
+        self.load(game, state)
+        i = game.players().index(game.player_at_turn(state))
+        if self.empty == self.fields and not self.full_width:
+            return game.rc_to_idx(game.h // 2, game.w // 2)
+        move = self.value = None
+        last = min(self.max_depth or self.empty, self.empty)
+        # small boards are solved by a search to the end of game, it is faster than iterative
+        # deepening through all heuristic values; those only give a move in case it runs out of time
+        solve = self.full_width and self.max_depth is None
+        solve_after = time() + 0.25 * self.time_limit
+        try:
+            for depth in range(1, last + 1):
+                if solve and time() > solve_after:
+                    depth = last
+                self.value, move = self.search_root(depth, i, move)
+                if abs(self.value) >= self.WIN or depth == last:
+                    break
+        except SearchTimeout:
+            # search was interrupted between place and remove, search state is loaded again
+            self.load(game, state)
+        if move is None:
+            move = self.moves(None, i)[0]
+        return move
+
+
 ################################ MAIN PROGRAM #################################
 
 if __name__ == '__main__':
@@ -101,3 +594,7 @@ if __name__ == '__main__':
     ## c) play N games
     TicTacToe().play_n_games([MyPlayer(), RandomPlayer()], n=10)
     # Gomoku().play_n_games([MyPlayer(), RandomPlayer()], n=10)
+    # Gomoku().play_n_games([ThreatPlayer(time_limit=1.0), MyPlayer()], n=10)
+    # TicTacToe(4, 4, 3).play_n_games([AlphaBetaPlayer(), MyPlayer()], n=10)
+    ## d) play N games in parallel processes
+    # print(TicTacToe().play_tournament([MyPlayer(), RandomPlayer()], n=1000, seed=0))
@@ -1,50 +1,229 @@
+import os
 import json
 import sys
-from queue import PriorityQueue
+import heapq
+from functools import lru_cache
 from math import radians, cos, sin, asin, sqrt
+import numpy as np
+
+
+# Files of compiled graph (see compile_graph), all loaded by np.load with mmap_mode='r'
+GRAPH_FILES = ['offsets', 'targets', 'lengths', 'coords', 'landmarks', 'landmark_distances', 'names']
+LANDMARKS = 12  # number of landmarks for ALT heuristic
+# Optional all-pairs table (see compile_all_pairs), stored next to the graph
+ALL_PAIRS_FILES = ['all_pairs_distances', 'all_pairs_next']
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    # (You don`t need to understand following code - it`s just geo-stuff)
+    # Calculate the great circle distance between two points on the earth (specified in
+    # decimal degrees)
+    # Courtesy of http://stackoverflow.com/a/15737218
+
+    # convert decimal degrees to radians
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    # haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    km = 6367 * c
+    return km
+
+
+def haversine_np(lon1, lat1, lon2, lat2):
+    # haversine for numpy arrays of coordinates (or array and one point)
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 6367 * 2 * np.arcsin(np.sqrt(a))
+
+
+def dijkstra(offsets, targets, lengths, source, goals=None):
+    # Shortest paths from source in graph given by CSR arrays (lists). Returns (distances,
+    # parents): lengths of the shortest paths to all stops (inf if stop can`t be reached) and
+    # previous stop on the path to every stop (None for source and unreachable stops). If goals
+    # are given, search ends when all of them are reached, other stops may be left unfinished.
+    distances = [float('inf')] * (len(offsets) - 1)
+    parents = [None] * (len(offsets) - 1)
+    distances[source] = 0.0
+    heap = [(0.0, source)]
+    remaining = set(goals) if goals is not None else None
+    while heap:
+        d, stop = heapq.heappop(heap)
+        if d > distances[stop]:
+            continue
+        if remaining is not None:
+            remaining.discard(stop)
+            if not remaining:
+                break
+        for k in range(offsets[stop], offsets[stop + 1]):
+            neighbor, nd = targets[k], d + lengths[k]
+            if nd < distances[neighbor]:
+                distances[neighbor] = nd
+                parents[neighbor] = stop
+                heapq.heappush(heap, (nd, neighbor))
+    return distances, parents
+
+
+def select_landmarks(offsets, targets, lengths, count):
+    # Landmarks for ALT heuristic chosen by farthest-point selection: the first one is the stop
+    # farthest from stop 0, every next one is the stop farthest from all chosen ones. Returns
+    # (landmarks, distances from every landmark to all stops).
+    distances = np.array(dijkstra(offsets, targets, lengths, 0)[0])
+    nearest = np.where(np.isinf(distances), -1.0, distances)  # unreachable stops are never chosen
+    landmarks, table = [], []
+    for _ in range(count):
+        landmark = int(np.argmax(nearest))
+        landmarks.append(landmark)
+        table.append(dijkstra(offsets, targets, lengths, landmark)[0])
+        nearest = np.minimum(nearest, np.where(np.isinf(table[-1]), -1.0, table[-1]))
+    return landmarks, np.array(table)
+
+
+def compile_graph(db_file, graph_dir, landmarks=LANDMARKS):
+    # Compile json database into graph stored as numpy arrays in graph_dir. Stops get ids 0..n-1
+    # (stops with neighbors first, in order of the database). Neighbors of stop i are
+    # targets[offsets[i]:offsets[i + 1]] (CSR adjacency), lengths are lengths of these edges in
+    # km, coords are [lon, lat] of every stop and names are names of stops. Lines of
+    # landmark_distances are lengths of the shortest paths from landmarks to all stops.
+    data = json.load(open(db_file, 'r'))
+    names = list(data['neighbors']) + [name for name in data['bus_stops'] if name not in data['neighbors']]
+    ids = {name: i for i, name in enumerate(names)}
+    coords = np.array([data['bus_stops'][name] for name in names], dtype=np.float64)
+    offsets, targets, lengths = [0], [], []
+    for i, name in enumerate(names):
+        for neighbor in data['neighbors'].get(name, []):
+            j = ids[neighbor]
+            targets.append(j)
+            lengths.append(haversine(*coords[i], *coords[j]))
+        offsets.append(len(targets))
+    landmarks, landmark_distances = select_landmarks(offsets, targets, lengths, landmarks)
+    os.makedirs(graph_dir, exist_ok=True)
+    arrays = {'offsets': np.array(offsets, dtype=np.int32),
+              'targets': np.array(targets, dtype=np.int32),
+              'lengths': np.array(lengths, dtype=np.float64),
+              'coords': coords,
+              'landmarks': np.array(landmarks, dtype=np.int32),
+              'landmark_distances': landmark_distances,
+              'names': np.array(names)}
+    for name in GRAPH_FILES:  # names last, its time tells when compilation finished
+        np.save(os.path.join(graph_dir, name + '.npy'), arrays[name])
+
+
+def compile_all_pairs(bamhd, graph_dir):
+    # All-pairs table of the graph of bamhd stored as numpy matrices in graph_dir:
+    # all_pairs_distances[s, t] is length of the shortest path from s to t (inf if there is none)
+    # and all_pairs_next[s, t] the stop after s on it (-1 if s == t or there is no path). Edges go
+    # both ways, so column t is one Dijkstra from t - its parents are next stops towards t.
+    n = len(bamhd.names)
+    distances = np.empty((n, n), dtype=np.float64)
+    next_stops = np.full((n, n), -1, dtype=np.int32)
+    for t in range(n):
+        d, parents = bamhd.shortest_path_tree(t)
+        distances[:, t] = d
+        next_stops[:, t] = [-1 if parent is None else parent for parent in parents]
+    np.save(os.path.join(graph_dir, 'all_pairs_distances.npy'), distances)
+    np.save(os.path.join(graph_dir, 'all_pairs_next.npy'), next_stops)
+
 
 class BaMHD(object):
-    def __init__(self, db_file='ba_mhd_db.json'):
-        # Initialize BaMHD object, load data from json file
-        self.data = json.load(open(db_file, 'r'))
+    def __init__(self, db_file='ba_mhd_db.json', graph_dir=None, cache_size=1 << 16, all_pairs=False):
+        # Initialize BaMHD object, load graph compiled from json file. The graph is compiled
+        # (into graph_dir, default is name of db_file with _graph suffix) when it is missing or
+        # older than db_file. Distances between stops are cached in LRU cache of cache_size.
+        # all_pairs: load (and compile if needed) all-pairs table, paths are then read from it.
+        graph_dir = self.graph_dir = graph_dir or os.path.splitext(db_file)[0] + '_graph'
+        files = [os.path.join(graph_dir, name + '.npy') for name in GRAPH_FILES]
+        if not all(map(os.path.exists, files)) or os.path.getmtime(files[-1]) < os.path.getmtime(db_file):
+            compile_graph(db_file, graph_dir)
+        for name in GRAPH_FILES:
+            setattr(self, name, np.load(os.path.join(graph_dir, name + '.npy'), mmap_mode='r'))
+        self.ids = {name: i for i, name in enumerate(self.names.tolist())}
+        self.cached_distance = lru_cache(maxsize=cache_size)(self.compute_distance)
+        self.csr = None  # adjacency as lists, for Dijkstra
+        self.all_pairs_distances = self.all_pairs_next = None
+        if all_pairs:
+            self.load_all_pairs()
+
+    def load_all_pairs(self):
+        # Load all-pairs table, compile it first if it is missing or older than the graph
+        files = [os.path.join(self.graph_dir, name + '.npy') for name in ALL_PAIRS_FILES]
+        graph = os.path.join(self.graph_dir, GRAPH_FILES[-1] + '.npy')
+        if not all(map(os.path.exists, files)) or min(map(os.path.getmtime, files)) < os.path.getmtime(graph):
+            compile_all_pairs(self, self.graph_dir)
+        self.all_pairs_distances, self.all_pairs_next = (np.load(f, mmap_mode='r') for f in files)
+
+    def shortest_path_tree(self, stop, goals=None):
+        # Return (distances, parents) of Dijkstra from stop, see dijkstra
+        if self.csr is None:
+            self.csr = (self.offsets.tolist(), self.targets.tolist(), self.lengths.tolist())
+        return dijkstra(*self.csr, self.id(stop), goals)
+
+    def table_path(self, stop1, stop2):
+        # Return (path as list of stop ids, its length) read from all-pairs table, path is None if
+        # there is no path
+        s, t = self.id(stop1), self.id(stop2)
+        length = float(self.all_pairs_distances[s, t])
+        if length == float('inf'):
+            return None, length
+        path = [s]
+        while s != t:
+            s = int(self.all_pairs_next[s, t])
+            path.append(s)
+        return path, length
+
+    def id(self, stop):
+        # Id of stop given by name, BusStop or id
+        if isinstance(stop, BusStop): stop = stop.name
+        return self.ids[stop] if isinstance(stop, str) else stop
+
+    def name(self, stop):
+        return str(self.names[self.id(stop)])
 
     def distance(self, stop1, stop2):
         # Return distance between two stops in km.
-        if isinstance(stop1, BusStop): stop1 = stop1.name
-        if isinstance(stop2, BusStop): stop2 = stop2.name
-        coords1 = self.data['bus_stops'][stop1]
-        coords2 = self.data['bus_stops'][stop2]
-
-        def haversine(lon1, lat1, lon2, lat2):
-            # (You don`t need to understand following code - it`s just geo-stuff)
-            # Calculate the great circle distance between two points on the earth (specified in
-            # decimal degrees)
-            # Courtesy of http://stackoverflow.com/a/15737218
-
-            # convert decimal degrees to radians
-            lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-            # haversine formula
-            dlon = lon2 - lon1
-            dlat = lat2 - lat1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * asin(sqrt(a))
-            km = 6367 * c
-            return km
-
-        return haversine(coords1[0], coords1[1], coords2[0], coords2[1])
+        i, j = self.id(stop1), self.id(stop2)
+        return self.cached_distance(min(i, j), max(i, j))
+
+    def compute_distance(self, i, j):
+        lon1, lat1 = self.coords[i]
+        lon2, lat2 = self.coords[j]
+        return haversine(lon1, lat1, lon2, lat2)
+
+    def distances_to(self, stop):
+        # Return list of distances of all stops (by id) to given stop, computed in one pass
+        lon, lat = self.coords[self.id(stop)]
+        return haversine_np(self.coords[:, 0], self.coords[:, 1], lon, lat).tolist()
+
+    def landmark_bounds_to(self, stop):
+        # Return list of ALT lower bounds of distances of all stops to given stop: by triangle
+        # inequality |d(L, stop) - d(L, v)| <= d(v, stop) for every landmark L. Bound is at least
+        # the air distance.
+        column = self.landmark_distances[:, self.id(stop)][:, None]
+        with np.errstate(invalid='ignore'):
+            bounds = np.abs(column - self.landmark_distances)
+        bounds = np.where(np.isnan(bounds), 0.0, bounds).max(axis=0)  # both unreachable from L
+        return np.maximum(bounds, self.distances_to(stop)).tolist()
+
+    def edges(self, stop):
+        # Return list of (neighbor id, edge length) for a given stop
+        i = self.id(stop)
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return list(zip(self.targets[a:b].tolist(), self.lengths[a:b].tolist()))
 
     def neighbors(self, stop):
-        # Return neighbors for a given stop
-        return self.data['neighbors'][stop.name if isinstance(stop, BusStop) else stop]
+        # Return neighbors (names) for a given stop
+        return [str(self.names[j]) for j, _ in self.edges(stop)]
 
     def stops(self):
-        # Return list of all stops (names only)
-        return self.data['neighbors'].keys()
+        # Return list of all stops with neighbors (names only)
+        degrees = np.diff(self.offsets)
+        return [str(name) for name, degree in zip(self.names, degrees) if degree > 0]
 
 
 class BusStop(object):
-    # Object representing node in graph traversal. Includes name, parent node, and total cost of
-    # path from root to this node (i.e. distance from start).
+    # Object representing node in graph traversal. Includes name (or id), parent node, and total
+    # cost of path from root to this node (i.e. distance from start).
     def __init__(self, name, parent = None, pathLength = 0):
         self.name = name
         self.parent = parent
@@ -59,71 +238,168 @@ class BusStop(object):
             path.append(self.name)
             return path
 
-class BSUC(BusStop):
-    def __lt__(self, busStop):
-        return self.pathLength < busStop.pathLength
+def search(bamhd, stopA, stopB, heuristic):
+    # Best-first search from stopA to stopB by priority g + heuristic(stop), where g is length of
+    # the path from stopA. OPEN list is a heap of (priority, counter, stop id) - counter breaks
+    # ties in order of insertion. Stop is pushed only if the new path to it is shorter than the
+    # best one found so far. Returns (path as list of stop ids, its length in km, number of stops
+    # added to OPEN list, number of stops really pushed to the heap); path is None if stopB can`t
+    # be reached. Stops added to OPEN list are counted as in the original search - every
+    # generated successor, even the ones which are not pushed.
+    start, goal = bamhd.id(stopA), bamhd.id(stopB)
+    best = {start: 0.0}  # length of the best known path to every reached stop
+    parents = {start: None}
+    closed = set()
+    heap = [(heuristic(start), 0, start)]
+    generated = pushed = 1
+    while heap:
+        _, _, stop = heapq.heappop(heap)
+        if stop in closed:
+            continue
+        closed.add(stop)
+        if stop == goal:
+            path = []
+            while stop is not None:
+                path.append(stop)
+                stop = parents[stop]
+            return path[::-1], best[goal], generated, pushed
+        g = best[stop]
+        for neighbor, length in bamhd.edges(stop):
+            generated += 1
+            pathLength = g + length
+            if neighbor in closed or pathLength >= best.get(neighbor, float('inf')):
+                continue
+            best[neighbor] = pathLength
+            parents[neighbor] = stop
+            heapq.heappush(heap, (pathLength + heuristic(neighbor), pushed, neighbor))
+            pushed += 1
+    return None, float('inf'), generated, pushed
+
+
+def report(bamhd, path, length, num):
+    # Print statistics of search and return the path as list of stop names
+    if path is None:
+        return ["No path found"]
+    print(f'\t{num} bus stops in "OPEN list", length = {length}km')
+    return [bamhd.name(stop) for stop in path]
+
 
-class BSAS(BusStop):
-    def __init__(self, name, parent = None, pathLength = 0, h = 0):
-        super().__init__(name, parent, pathLength)
-        self.h = h
-        
-    def __lt__(self, busStop):
-        return self.pathLength + self.h < busStop.pathLength + busStop.h
+def bidirectional_search(bamhd, stopA, stopB, to_goal, to_start):
+    # Bidirectional A*: forward search from stopA and backward search from stopB (edges of the
+    # graph go both ways). to_goal and to_start are heuristic distances of all stops to stopB and
+    # to stopA; forward search uses potential p(v) = (to_goal[v] - to_start[v]) / 2 and backward
+    # one -p(v), which keeps both of them consistent. Search ends when sum of the best priorities
+    # of both OPEN lists reaches length of the best path found. Returns the same as search.
+    start, goal = bamhd.id(stopA), bamhd.id(stopB)
+    if start == goal:
+        return [start], 0.0, 1, 1
+    potential = [(a - b) / 2 for a, b in zip(to_goal, to_start)]
+    signs = (1, -1)
+    best = ({start: 0.0}, {goal: 0.0})
+    parents = ({start: None}, {goal: None})
+    closed = (set(), set())
+    heaps = ([(potential[start], 0, start)], [(-potential[goal], 1, goal)])
+    generated = pushed = 2
+    shortest, meet = float('inf'), None
+    while heaps[0] and heaps[1] and heaps[0][0][0] + heaps[1][0][0] < shortest:
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        _, _, stop = heapq.heappop(heaps[side])
+        if stop in closed[side]:
+            continue
+        closed[side].add(stop)
+        g, other = best[side][stop], best[1 - side]
+        for neighbor, length in bamhd.edges(stop):
+            generated += 1
+            pathLength = g + length
+            if neighbor in closed[side] or pathLength >= best[side].get(neighbor, float('inf')):
+                continue
+            best[side][neighbor] = pathLength
+            parents[side][neighbor] = stop
+            heapq.heappush(heaps[side], (pathLength + signs[side] * potential[neighbor], pushed, neighbor))
+            pushed += 1
+            if neighbor in other and pathLength + other[neighbor] < shortest:
+                shortest, meet = pathLength + other[neighbor], neighbor
+    if meet is None:
+        return None, float('inf'), generated, pushed
+    path = []
+    stop = meet
+    while stop is not None:
+        path.append(stop)
+        stop = parents[0][stop]
+    path.reverse()
+    stop = parents[1][meet]
+    while stop is not None:
+        path.append(stop)
+        stop = parents[1][stop]
+    return path, shortest, generated, pushed
 
 
 def findPathUniformCost(bamhd, stopA, stopB):
     # Implement Uniform-cost search to find shortest path between two MHD stops in Bratislava.
     # Return a list of MHD stops, print how many bus stops were added to the "OPEN list"
     # and total path length in km.
-
-    o = PriorityQueue()
-    o.put(BSUC(stopA))
-    res = None
-    num = 1
-    c = []
-    while o.not_empty:
-        n = o.get()
-        if n.name in c:
-            continue
-        c.append(n.name)
-        if n.name == stopB:
-            res = n
-            break
-        for node in bamhd.neighbors(n):
-            num += 1
-            pathLength = bamhd.distance(n.name, node) + n.pathLength
-            o.put(BSUC(node, n, pathLength))
-    if res is None:
-        return ["No path found"]
-    print(f'\t{num} bus stops in "OPEN list", length = {res.pathLength}km')
-    return res.traceBackPath()
+    return report(bamhd, *search(bamhd, stopA, stopB, lambda stop: 0.0)[:3])
 
 
 def findPathAStar(bamhd, stopA, stopB):
-    o = PriorityQueue()
-    h = bamhd.distance(stopA, stopB)
-    o.put(BSAS(stopA, h=h))
-    num = 1
-    c = []
-    res = None
-    while o.not_empty:
-        n = o.get()
-        if n.name in c:
-            continue
-        c.append(n.name)
-        if n.name == stopB:
-            res = n
-            break
-        for node in bamhd.neighbors(n):
-            num += 1
-            h = bamhd.distance(node, stopB)
-            pathLength = bamhd.distance(n.name, node) + n.pathLength
-            o.put(BSAS(node, n, pathLength, h))
-    if res is None:
-        return ["No path found"]
-    print(f'\t{num} bus stops in "OPEN list", length = {res.pathLength}km')
-    return res.traceBackPath()
+    # A* search, heuristic is air distance to stopB (computed for all stops at once)
+    return report(bamhd, *search(bamhd, stopA, stopB, bamhd.distances_to(stopB).__getitem__)[:3])
+
+
+def findPathBidirectionalAStar(bamhd, stopA, stopB):
+    # Bidirectional A* search, heuristic is air distance
+    return report(bamhd, *bidirectional_search(bamhd, stopA, stopB, bamhd.distances_to(stopB),
+                                               bamhd.distances_to(stopA))[:3])
+
+
+def findPathALT(bamhd, stopA, stopB):
+    # A* search with ALT heuristic (landmarks and triangle inequality)
+    return report(bamhd, *search(bamhd, stopA, stopB, bamhd.landmark_bounds_to(stopB).__getitem__)[:3])
+
+
+def findPathsBatch(bamhd, pairs):
+    # Shortest paths for many (from, to) pairs of stops. Pairs are grouped by source stop and
+    # paths from one source are read from one Dijkstra (which ends when all their targets are
+    # reached), or from all-pairs table if it is loaded. Returns list of (path as list of stop
+    # names, length in km) in order of pairs; path is None if there is no path.
+    groups = {}
+    for k, (a, b) in enumerate(pairs):
+        groups.setdefault(bamhd.id(a), []).append((k, bamhd.id(b)))
+    results = [None] * len(pairs)
+    for source, queries in groups.items():
+        if bamhd.all_pairs_distances is not None:
+            found = [bamhd.table_path(source, t) for _, t in queries]
+        else:
+            distances, parents = bamhd.shortest_path_tree(source, [t for _, t in queries])
+            found = []
+            for _, t in queries:
+                if distances[t] == float('inf'):
+                    found.append((None, distances[t]))
+                    continue
+                path = [t]
+                while path[-1] != source:
+                    path.append(parents[path[-1]])
+                found.append((path[::-1], distances[t]))
+        for (k, _), (path, length) in zip(queries, found):
+            results[k] = (None if path is None else [bamhd.name(stop) for stop in path], length)
+    return results
+
+
+def compare_searches(bamhd, pairs):
+    # Print number of stops added to OPEN list and number of stops pushed to the heap by every
+    # search for given pairs of stops
+    searches = [('UCS', lambda a, b: search(bamhd, a, b, lambda stop: 0.0)),
+                ('A*', lambda a, b: search(bamhd, a, b, bamhd.distances_to(b).__getitem__)),
+                ('bidir A*', lambda a, b: bidirectional_search(bamhd, a, b, bamhd.distances_to(b),
+                                                               bamhd.distances_to(a))),
+                ('ALT', lambda a, b: search(bamhd, a, b, bamhd.landmark_bounds_to(b).__getitem__))]
+    print('OPEN list / pushed: ' + ', '.join(name for name, _ in searches))
+    totals = [(0, 0)] * len(searches)
+    for a, b in pairs:
+        counts = [f(a, b)[2:] for _, f in searches]
+        totals = [(t + c, u + d) for (t, u), (c, d) in zip(totals, counts)]
+        print(f'\t{a} - {b}: ' + ', '.join(f'{c} / {d}' for c, d in counts))
+    print('\ttotal: ' + ', '.join(f'{c} / {d}' for c, d in totals))
 
 
 if __name__ == "__main__":
@@ -150,3 +426,32 @@ if __name__ == "__main__":
     print('VW - Astronomicka:')
     path = findPathAStar(bamhd, 'Volkswagen', 'Astronomicka')
     print(f'\tpath: {path}')
+
+    # C) Bidirectional A* search
+    print('\nBidirectional A* search:')
+    print('Zoo - Aupark:')
+    path = findPathBidirectionalAStar(bamhd, 'Zoo', 'Aupark')
+    print(f'\tpath: {path}')
+
+    print('VW - Astronomicka:')
+    path = findPathBidirectionalAStar(bamhd, 'Volkswagen', 'Astronomicka')
+    print(f'\tpath: {path}')
+
+    # D) A* search with landmarks (ALT)
+    print('\nALT search:')
+    print('Zoo - Aupark:')
+    path = findPathALT(bamhd, 'Zoo', 'Aupark')
+    print(f'\tpath: {path}')
+
+    print('VW - Astronomicka:')
+    path = findPathALT(bamhd, 'Volkswagen', 'Astronomicka')
+    print(f'\tpath: {path}')
+
+    print()
+    compare_searches(bamhd, [('Zoo', 'Aupark'), ('Volkswagen', 'Astronomicka')])
+
+    # E) Many queries at once - one Dijkstra per source stop, or walks in all-pairs table
+    print('\nBatch queries:')
+    pairs = [('Zoo', 'Aupark'), ('Volkswagen', 'Astronomicka'), ('Zoo', 'Astronomicka')]
+    for (a, b), (path, length) in zip(pairs, findPathsBatch(BaMHD(all_pairs=True), pairs)):
+        print(f'{a} - {b}: length = {length}km\n\tpath: {path}')
@@ -1,5 +1,8 @@
+import io
 import random
 from time import time
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
 
 
 ############################### GAME DEFINITION ###############################
@@ -45,8 +48,10 @@ class Game:
         # Pretty-print given state of the game
         pass
 
-    def play(self, players, show_moves=True):
+    def play(self, players, show_moves=True, move_times=None):
         # Executes one match of the game. Returns index of winning player, or -1 if draw.
+        # If move_times is given (two lists), time of every move of player i is appended to
+        # move_times[i].
         assert len(players) == 2, 'Game must be played by exactly two players!'
         state = self.initial_state()
         if show_moves:
@@ -55,7 +60,10 @@ class Game:
             for i, player in enumerate(players):
                 p_char = self.player_at_turn(state)
                 # Choose move
+                t = time()
                 move = player.choose_move(self, state)
+                if move_times is not None:
+                    move_times[i].append(time() - t)
                 # Make move
                 state = self.state_after_move(state, move)
                 if state is None:
@@ -99,30 +107,171 @@ class Game:
         print('\tplayer 1: {} win, {} draw, {} lost, total score: {}'.format(*results[0], score1 / n))
         print('\tplayer 2: {} win, {} draw, {} lost, total score: {}'.format(*results[1], -score1 / n))
 
+    def play_tournament(self, players, n, workers=None, seed=0):
+        # Same as play_n_games, but games are played in parallel by worker processes and results
+        # are returned as TournamentResult instead of printed. Game i starts with random.seed(seed + i)
+        # so the tournament can be repeated; player 1 starts in even games, player 2 in odd ones.
+        result = TournamentResult()
+        tasks = [(self, players, i, seed + i) for i in range(n)]
+        with ProcessPoolExecutor(workers) as pool:
+            for winner, move_times in pool.map(play_tournament_game, tasks, chunksize=max(1, n // 64)):
+                result.add_game(winner, move_times)
+        return result
+
+
+
+def play_tournament_game(task):
+    # Play one game of tournament in worker process. Returns (winner, move times) with winner and
+    # move times indexed by the original order of players (winner -1 means draw).
+    game, players, i, seed = task
+    random.seed(seed)
+    order = [0, 1] if i % 2 == 0 else [1, 0]
+    move_times = [[], []]
+    with redirect_stdout(io.StringIO()):
+        w = game.play([players[j] for j in order], show_moves=False, move_times=move_times)
+    winner = w if w < 0 else order[w]
+    return winner, [move_times[order.index(j)] for j in range(2)]
+
+
+
+class TournamentResult:
+    # Results of play_tournament: wins/draws/losses of both players, score of player 1 (win 1,
+    # draw 0, loss -1, averaged over games; score of player 2 is the opposite) and times of all
+    # moves of each player.
+    def __init__(self):
+        self.games = 0
+        self.results = [[0]*3, [0]*3]  # [win, draw, lost] for player 1 and player 2
+        self.score1 = 0
+        self.move_times = [[], []]
+
+    def add_game(self, winner, move_times):
+        self.games += 1
+        self.score1 += winner + 1 if winner < 1 else -1
+        if winner == -1:
+            self.results[0][1] += 1
+            self.results[1][1] += 1
+        else:
+            self.results[winner][0] += 1
+            self.results[1 - winner][2] += 1
+        for i in range(2):
+            self.move_times[i].extend(move_times[i])
+
+    def score(self, player=0):
+        s = self.score1 / self.games if self.games else 0.0
+        return s if player == 0 else -s
+
+    def move_time_percentiles(self, player, percentiles=(50, 90, 99, 100)):
+        # Move time percentiles (nearest-rank) of player, dict percentile -> seconds
+        times = sorted(self.move_times[player])
+        if not times:
+            return {p: 0.0 for p in percentiles}
+        return {p: times[max(0, -(-p * len(times) // 100) - 1)] for p in percentiles}
+
+    def as_dict(self):
+        return {'games': self.games,
+                'players': [{'win': w, 'draw': d, 'lost': l, 'score': self.score(i),
+                             'moves': len(self.move_times[i]),
+                             'move_time_percentiles': self.move_time_percentiles(i)}
+                            for i, (w, d, l) in enumerate(self.results)]}
+
+    def __str__(self):
+        lines = ['Results of {} games:'.format(self.games)]
+        for i in range(2):
+            p = self.move_time_percentiles(i)
+            lines.append('\tplayer {}: {} win, {} draw, {} lost, total score: {}, move time p50 {:.4f}s, '
+                         'p90 {:.4f}s, p99 {:.4f}s, max {:.4f}s'
+                         .format(i + 1, *self.results[i], self.score(i), p[50], p[90], p[99], p[100]))
+        return '\n'.join(lines)
+
+
+
+def mask_fields(mask):
+    # Fields (indices of set bits) of bit mask in increasing order
+    fields = []
+    while mask:
+        low = mask & -mask
+        fields.append(low.bit_length() - 1)
+        mask ^= low
+    return fields
+
+
+
+class TicTacToeState:
+    # Immutable state of TicTacToe. Stones are two bit masks, x and o (bit idx is set if the
+    # player`s stone is on field idx), 'near' is bit mask of candidate moves (see
+    # TicTacToe.candidate_moves), so a state is one small object with a few ints even on big
+    # board. Empty fields and the board itself are derived from the masks by the game (see
+    # TicTacToe.free and board_in_state). States are hashable and can be used as dict keys.
+    # Dict-like access of older code still works for attributes, e.g. state['player_on_turn'].
+    __slots__ = ('x', 'o', 'player_on_turn', 'utility', 'empty', 'near')
+
+    def __init__(self, x, o, player_on_turn, utility, empty, near):
+        init = object.__setattr__
+        init(self, 'x', x)
+        init(self, 'o', o)
+        init(self, 'player_on_turn', player_on_turn)
+        init(self, 'utility', utility)
+        init(self, 'empty', empty)
+        init(self, 'near', near)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TicTacToeState is immutable')
+
+    def __reduce__(self):
+        return TicTacToeState, tuple(getattr(self, name) for name in self.__slots__)
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __eq__(self, other):
+        return (isinstance(other, TicTacToeState) and self.x == other.x and self.o == other.o and
+                self.player_on_turn == other.player_on_turn)
+
+    def __hash__(self):
+        return hash((self.x, self.o, self.player_on_turn))
+
 
 
 class TicTacToe(Game):
-    def __init__(self, h=3, w=3, k=3):
+    def __init__(self, h=3, w=3, k=3, d=2):
         self.h = h
         self.w = w
         self.k = k
         self.fields = self.h*self.w
+        self.full = (1 << self.fields) - 1  # bit mask of all fields
         self.win_unility = 1
+        # d: candidate moves (see candidate_moves) are empty fields at most d rows and columns
+        # away from some stone; neighbours[idx] is bit mask of all fields that near to field idx
+        self.d = d
+        self.neighbours = [sum(1 << self.rc_to_idx(rr, cc)
+                               for rr in range(max(0, r - d), min(self.h, r + d + 1))
+                               for cc in range(max(0, c - d), min(self.w, c + d + 1)))
+                           for r, c in map(self.idx_to_rc, range(self.fields))]
 
     def initial_state(self):
-        return {'player_on_turn': 'X',
-                'board': [[' ']*self.w]*self.h,
-                'utility': 0}
+        # 'empty' (number of empty fields) and 'near' are updated by every move, so checking full
+        # board and validity of a move doesn`t need to scan the board
+        return TicTacToeState(0, 0, 'X', 0, self.fields, 0)
 
     def players(self):
         return ['X', 'O']
 
     def actions(self, state):
-        return [self.rc_to_idx(r, c) for r in range(self.h) for c in range(self.w) if state['board'][r][c] == ' ']
+        return mask_fields(self.free(state))
+
+    def free(self, state):
+        # Bit mask of empty fields
+        return self.full & ~(state.x | state.o)
+
+    def candidate_moves(self, state):
+        # Valid moves at most d rows and columns away from some stone (all valid moves on empty
+        # board). Far moves are rarely good, so players can search only these instead of actions.
+        return mask_fields(state.near) if state.near else self.actions(state)
 
     def is_terminal(self, state):
-        return len(self.actions(state)) == 0 or \
-            self.utility(state, state['player_on_turn']) != 0
+        return state.empty == 0 or state.utility != 0
 
     def rc_to_idx(self, r, c):
         return r*self.w + c
@@ -130,20 +279,21 @@ class TicTacToe(Game):
     def idx_to_rc(self, idx):
         return idx // self.w, idx % self.w
 
-    def k_in_row(self, board, position, player, delta):
+    def k_in_row(self, stones, position, delta):
+        # stones is bit mask of stones of one player
         dr, dc = delta
         n = 0
         r, c = self.idx_to_rc(position)
         while (0 <= r < self.h and
                0 <= c < self.w and
-               board[r][c] == player):
+               stones >> (r*self.w + c) & 1):
             r, c = r + dr, c + dc
             n += 1
 
         r, c = self.idx_to_rc(position)
         while (0 <= r < self.h and
                0 <= c < self.w and
-               board[r][c] == player):
+               stones >> (r*self.w + c) & 1):
             r, c = r - dr, c - dc
             n += 1
 
@@ -151,43 +301,58 @@ class TicTacToe(Game):
         return n >= self.k
 
     def utility(self, state, player):
-        utility = state['utility']
-        return utility if player != state['player_on_turn'] else -utility
-
-    def compute_utility(self, board, move, player):
-        if (self.k_in_row(board, move, player, (1, 0)) or
-                self.k_in_row(board, move, player, (0, 1)) or
-                self.k_in_row(board, move, player, (1, 1)) or
-                self.k_in_row(board, move, player, (1, -1))):
+        utility = state.utility
+        return utility if player != state.player_on_turn else -utility
+
+    def compute_utility(self, stones, move):
+        if (self.k_in_row(stones, move, (1, 0)) or
+                self.k_in_row(stones, move, (0, 1)) or
+                self.k_in_row(stones, move, (1, 1)) or
+                self.k_in_row(stones, move, (1, -1))):
             return self.win_unility
         return 0
 
     def state_after_move(self, state, move):
-        if move not in self.actions(state):
-            print(move)
+        if not (0 <= move < self.fields and self.free(state) >> move & 1):
             raise ValueError("Invalid move")
 
-        player = state['player_on_turn']
-        board = [list(row) for row in state['board']]
-        r, c = self.idx_to_rc(move)
-        board[r][c] = player
-        return {'player_on_turn': self.other_player(player),
-                'board': board,
-                'utility': self.compute_utility(board, move, player)}
+        player = state.player_on_turn
+        x, o = state.x, state.o
+        if player == 'X':
+            x |= 1 << move
+            utility = self.compute_utility(x, move)
+        else:
+            o |= 1 << move
+            utility = self.compute_utility(o, move)
+        return TicTacToeState(x, o, self.other_player(player), utility, state.empty - 1,
+                              (state.near | self.neighbours[move]) & ~(x | o))
+
+    def switch_player(self, state):
+        # The same position with the other player at turn
+        return TicTacToeState(state.x, state.o, self.other_player(state.player_on_turn),
+                              state.utility, state.empty, state.near)
 
     def player_at_turn(self, state):
-        return state['player_on_turn']
+        return state.player_on_turn
 
     def board_in_state(self, state):
-        return state['board']
+        # list of rows (strings) of the board
+        board = []
+        for r in range(self.h):
+            row = ''
+            for c in range(self.w):
+                bit = 1 << self.rc_to_idx(r, c)
+                row += 'X' if state.x & bit else 'O' if state.o & bit else ' '
+            board.append(row)
+        return board
 
     def other_player(self, player):
         return 'X' if player == 'O' else 'O'
 
     def display_state(self, state, show_nums=False):
-        board = state['board']
+        board = self.board_in_state(state)
         pos = 0
-        dig = len(str(len(self.actions(state))))
+        dig = len(str(state.empty))
         for r in range(self.h):
             print('|', end='')
             for c in range(self.w):
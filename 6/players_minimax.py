@@ -182,7 +182,7 @@ class AlphaBetaEvalPlayer(Player):
                             a = 0
                     mx = max(a, mx)
                 return mx
-            board = state["board"]
+            board = game.board_in_state(state)
         
             player = game.other_player(my_player)
             if max_row(board, player) >= 3:  # if oponent have more than 3 in a row we predict that we will lose
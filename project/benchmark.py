@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import statistics
+import argparse
+import importlib.util
+from time import perf_counter
+from games import Reversi
+from minimax import MyPlayer, random_positions
+
+
+# Benchmark suite of the game engines: fixed, seeded positions of every game in the opening,
+# midgame and endgame, on which move generation, state_after_move, perft (number of leaf nodes
+# of the full game tree to given depth) and fixed-depth MyPlayer search are measured.
+# Perft node counts and search results don`t depend on speed, so they are checked for exact
+# equality with the baseline - any difference means an engine change broke the rules.
+#
+# Perft from the initial state is also checked against known counts, so broken rules are found
+# even without a baseline. A slowdown is reported only if it shows again when the game is
+# measured once more, single noisy measurements don`t fail the run.
+#
+#   python benchmark.py --save        measure and store the baseline
+#   python benchmark.py               measure and compare with the baseline, exit code 1 if
+#                                     counts differ, anything got slower than threshold allows
+#                                     or there is no baseline
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+GAMES_1 = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '1', 'games.py')
+# perft of depth 1, 2, 3... from the initial state
+KNOWN_PERFT = {
+    'tictactoe': [9, 72, 504, 3024],
+    'reversi': [4, 12, 56, 244],
+    'reversi_bitboard': [4, 12, 56, 244],
+}
+
+
+def load_games_module(path=GAMES_1):
+    # TicTacToe and Gomoku live in games.py of another directory, which would clash with
+    # Reversi`s games module, so it is loaded under its own name (registered in sys.modules, so
+    # its games and states can be pickled for worker processes)
+    spec = importlib.util.spec_from_file_location('tictactoe_games', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def suite():
+    # name -> (game, arguments of bench_game): phases are numbers of random plies from the initial
+    # state, search_depth None means the game is not searched by MyPlayer
+    tictactoe = load_games_module()
+    return {
+        'tictactoe': (tictactoe.TicTacToe(), dict(phases=[0, 2, 4], perft_depth=5)),
+        'tictactoe_4x4': (tictactoe.TicTacToe(4, 4, 3), dict(phases=[0, 4, 8], perft_depth=4)),
+        'gomoku': (tictactoe.Gomoku(), dict(phases=[2, 20, 60], perft_depth=2, positions_per_phase=1)),
+        'reversi': (Reversi(), dict(phases=[4, 24, 44], perft_depth=3, search_depth=3)),
+        'reversi_bitboard': (Reversi(bitboard=True), dict(phases=[4, 24, 44], perft_depth=3, search_depth=3)),
+    }
+
+
+def perft(game, state, depth):
+    # Number of leaf nodes of the game tree of given depth (terminal states are leaves too)
+    if depth == 0 or game.is_terminal(state):
+        return 1
+    return sum(perft(game, game.state_after_move(state, move), depth - 1)
+               for move in game.actions(state))
+
+
+def timed(function, repeat, min_time):
+    # median time of runs of function and its (last) result; function runs at least repeat times
+    # and at least min_time seconds in total, so that short benchmarks are not just noise
+    times = []
+    while len(times) < repeat or sum(times) < min_time:
+        t = perf_counter()
+        result = function()
+        times.append(perf_counter() - t)
+    return statistics.median(times), result
+
+
+def bench_game(game, phases, perft_depth, search_depth=None, positions_per_phase=4, repeat=5, min_time=0.5,
+               seed=0):
+    # Results of one game: dict name -> {'rate': operations per second, 'check': value which
+    # must stay the same}. Rates are medians of timed runs (see timed).
+    positions = []
+    for i, plies in enumerate(phases):
+        positions.extend(random_positions(game, positions_per_phase, plies, seed + i))
+    results = {}
+
+    # generate_actions skips actions cache of Reversi, so the moves are really generated
+    generate = getattr(game, 'generate_actions', game.actions)
+    moves = [(state, move) for state in positions for move in game.actions(state)]
+    loops = max(1, 2000 // len(positions))
+    t, _ = timed(lambda: [generate(state) for _ in range(loops) for state in positions], repeat, min_time)
+    results['move_generation'] = {'rate': loops * len(positions) / t,
+                                  'check': sum(len(game.actions(state)) for state in positions)}
+
+    loops = max(1, 2000 // len(moves))
+    t, _ = timed(lambda: [game.state_after_move(state, move) for _ in range(loops) for state, move in moves],
+                 repeat, min_time)
+    results['state_after_move'] = {'rate': loops * len(moves) / t, 'check': len(moves)}
+
+    for phase, plies in enumerate(phases):
+        start = positions[phase * positions_per_phase:(phase + 1) * positions_per_phase]
+        t, counts = timed(lambda: [perft(game, state, perft_depth) for state in start], repeat, min_time)
+        results['perft_{}_ply{}'.format(perft_depth, plies)] = {'rate': sum(counts) / t, 'check': counts}
+
+    if search_depth is not None:
+        def search():
+            player = MyPlayer(depth=search_depth, endgame_empties=0)
+            chosen, nodes = [], 0
+            for state in positions:
+                chosen.append(player.choose_move(game, state))
+                nodes += player.nodes
+            player.close()
+            return chosen, nodes
+        t, (chosen, nodes) = timed(search, repeat, min_time)
+        results['search_depth{}'.format(search_depth)] = {'rate': nodes / t, 'check': [chosen, nodes]}
+    return results
+
+
+def run(names=None):
+    results = {}
+    for name, (game, arguments) in suite().items():
+        if names and name not in names:
+            continue
+        results[name] = bench_game(game, **arguments)
+        for bench, r in results[name].items():
+            print('{:18} {:22} {:12.0f} /s'.format(name, bench, r['rate']))
+    return results
+
+
+def check_known_perft(names=None):
+    # List of problems: perft counts from the initial state which differ from KNOWN_PERFT
+    problems = []
+    for name, (game, _) in suite().items():
+        if name not in KNOWN_PERFT or (names and name not in names):
+            continue
+        counts = [perft(game, game.initial_state(), depth) for depth in range(1, len(KNOWN_PERFT[name]) + 1)]
+        if counts != KNOWN_PERFT[name]:
+            problems.append('{} perft: {} differs from known counts {}'.format(name, counts, KNOWN_PERFT[name]))
+    return problems
+
+
+def compare(results, baseline, threshold):
+    # (changed checks, slowdowns): lists of (game name, problem) - checks which differ from the
+    # baseline and rates lower than (1 - threshold) * baseline rate
+    changed, slower = [], []
+    for name, benches in results.items():
+        for bench, r in benches.items():
+            base = baseline.get(name, {}).get(bench)
+            if base is None:
+                continue
+            if r['check'] != base['check']:
+                changed.append((name, '{} {}: result {} differs from baseline {}'
+                                      .format(name, bench, r['check'], base['check'])))
+            if r['rate'] < (1 - threshold) * base['rate']:
+                slower.append((name, '{} {}: {:.0f}/s is {:.0%} slower than baseline {:.0f}/s'
+                                     .format(name, bench, r['rate'], 1 - r['rate'] / base['rate'], base['rate'])))
+    return changed, slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark TicTacToe, Gomoku and Reversi engines')
+    parser.add_argument('games', nargs='*', help='games to run (default all)')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file')
+    parser.add_argument('--save', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown (0.2 = 20%%)')
+    args = parser.parse_args()
+    problems = check_known_perft(args.games)
+    # JSON turns tuples into lists, results go through the same conversion
+    results = json.loads(json.dumps(run(args.games)))
+    if args.save:
+        if not problems:
+            with open(args.baseline, 'w') as f:
+                json.dump(results, f, indent=1)
+            print('Baseline saved to {}'.format(args.baseline))
+    elif not os.path.exists(args.baseline):
+        problems.append('No baseline in {}, run with --save first'.format(args.baseline))
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed, slower = compare(results, baseline, args.threshold)
+        if slower:
+            # slowdown counts only if it shows again, with the better of both rates
+            names = sorted({name for name, _ in slower})
+            print('Measuring {} again'.format(', '.join(names)))
+            again = json.loads(json.dumps(run(names)))
+            for name in names:
+                for bench, r in again[name].items():
+                    results[name][bench]['rate'] = max(results[name][bench]['rate'], r['rate'])
+            _, slower = compare(results, baseline, args.threshold)
+        problems += [problem for _, problem in changed + slower]
+    for problem in problems:
+        print(problem)
+    print('FAILED' if problems else 'OK')
+    sys.exit(1 if problems else 0)
@@ -1,6 +1,9 @@
+import io
 import random
 import copy
 from time import time
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
 
 TIME_LIMIT = 5  # seconds
 
@@ -39,9 +42,11 @@ class Game:
     def display_state(self, state):
         pass
 
-    def play(self, players, can_break_limit=[False, False], show_moves=True):
+    def play(self, players, can_break_limit=[False, False], show_moves=True, move_times=None):
         # Executes one match of the game. Returns index of winning player, or -1 if draw.
         # can_break_limit determines whether player 1 or player 2 can break the time limit
+        # If move_times is given (two lists), time of every move of player i is appended to
+        # move_times[i].
         assert len(players) == 2, 'Game must be played by exactly two players!'
         assert len(can_break_limit) == 2, 'Must provide two values for can_break_limit!'
         state = self.initial_state()
@@ -54,6 +59,8 @@ class Game:
                 t = time()
                 move = player.choose_move(self, state)
                 t = time() - t
+                if move_times is not None:
+                    move_times[i].append(t)
                 if t > TIME_LIMIT and not can_break_limit[i]:
                     print('Player "{}" exceeded time limit ({:.3f}s) - his turn took {:.3f}s'
                           .format(p_char, TIME_LIMIT, t))
@@ -101,16 +108,143 @@ class Game:
         print('\tplayer 1: {} win, {} draw, {} lost, total score: {}'.format(*results[0], score1 / n))
         print('\tplayer 2: {} win, {} draw, {} lost, total score: {}'.format(*results[1], -score1 / n))
 
+    def play_tournament(self, players, n, can_break_limit=[False, False], workers=None, seed=0):
+        # Same as play_n_games, but games are played in parallel by worker processes and results
+        # are returned as TournamentResult instead of printed. Game i starts with random.seed(seed + i)
+        # so the tournament can be repeated; player 1 starts in even games, player 2 in odd ones.
+        result = TournamentResult()
+        tasks = [(self, players, i, seed + i, can_break_limit) for i in range(n)]
+        with ProcessPoolExecutor(workers) as pool:
+            for winner, move_times in pool.map(play_tournament_game, tasks, chunksize=max(1, n // 64)):
+                result.add_game(winner, move_times)
+        return result
+
+
+
+def play_tournament_game(task):
+    # Play one game of tournament in worker process. Returns (winner, move times) with winner and
+    # move times indexed by the original order of players (winner -1 means draw).
+    game, players, i, seed, can_break_limit = task
+    random.seed(seed)
+    order = [0, 1] if i % 2 == 0 else [1, 0]
+    move_times = [[], []]
+    with redirect_stdout(io.StringIO()):
+        w = game.play([players[j] for j in order], [can_break_limit[j] for j in order],
+                      show_moves=False, move_times=move_times)
+    winner = w if w < 0 else order[w]
+    return winner, [move_times[order.index(j)] for j in range(2)]
+
+
+
+class TournamentResult:
+    # Results of play_tournament: wins/draws/losses of both players, score of player 1 (win 1,
+    # draw 0, loss -1, averaged over games; score of player 2 is the opposite) and times of all
+    # moves of each player.
+    def __init__(self):
+        self.games = 0
+        self.results = [[0]*3, [0]*3]  # [win, draw, lost] for player 1 and player 2
+        self.score1 = 0
+        self.move_times = [[], []]
+
+    def add_game(self, winner, move_times):
+        self.games += 1
+        self.score1 += winner + 1 if winner < 1 else -1
+        if winner == -1:
+            self.results[0][1] += 1
+            self.results[1][1] += 1
+        else:
+            self.results[winner][0] += 1
+            self.results[1 - winner][2] += 1
+        for i in range(2):
+            self.move_times[i].extend(move_times[i])
+
+    def score(self, player=0):
+        s = self.score1 / self.games if self.games else 0.0
+        return s if player == 0 else -s
+
+    def move_time_percentiles(self, player, percentiles=(50, 90, 99, 100)):
+        # Move time percentiles (nearest-rank) of player, dict percentile -> seconds
+        times = sorted(self.move_times[player])
+        if not times:
+            return {p: 0.0 for p in percentiles}
+        return {p: times[max(0, -(-p * len(times) // 100) - 1)] for p in percentiles}
+
+    def as_dict(self):
+        return {'games': self.games,
+                'players': [{'win': w, 'draw': d, 'lost': l, 'score': self.score(i),
+                             'moves': len(self.move_times[i]),
+                             'move_time_percentiles': self.move_time_percentiles(i)}
+                            for i, (w, d, l) in enumerate(self.results)]}
+
+    def __str__(self):
+        lines = ['Results of {} games:'.format(self.games)]
+        for i in range(2):
+            p = self.move_time_percentiles(i)
+            lines.append('\tplayer {}: {} win, {} draw, {} lost, total score: {}, move time p50 {:.4f}s, '
+                         'p90 {:.4f}s, p99 {:.4f}s, max {:.4f}s'
+                         .format(i + 1, *self.results[i], self.score(i), p[50], p[90], p[99], p[100]))
+        return '\n'.join(lines)
+
+
+
+def popcount(mask):
+    # Number of set bits in mask (i.e. number of discs in occupancy mask)
+    return bin(mask).count('1')
+
+
+
+class BitboardState(dict):
+    # State of Reversi stored as two occupancy masks (state['B'], state['w']) and player at turn.
+    # Bit r*k + c of the mask is set if the player has disc at [r, c], so bit numbers are the
+    # same as action codes. Board (list of lists) is built only when somebody asks for it,
+    # so players reading state['board'] keep working.
+    __slots__ = ('k',)
+
+    def __init__(self, k, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.k = k
+
+    def __missing__(self, key):
+        if key != 'board':
+            raise KeyError(key)
+        board = [[' ']*self.k for _ in range(self.k)]
+        for player in ('B', 'w'):
+            mask = self[player]
+            while mask:
+                low = mask & -mask
+                r, c = divmod(low.bit_length() - 1, self.k)
+                board[r][c] = player
+                mask ^= low
+        return board
+
 
 
 class Reversi(Game):
     directions = [(r, c) for r in range(-1, 2) for c in range(-1, 2) if r|c != 0]
 
-    def __init__(self, k=8):
+    def __init__(self, k=8, bitboard=False):
         # Create game instance, k == size of the board.
+        # If bitboard: states are BitboardState (occupancy masks) and moves are generated by
+        # shifting the masks instead of walking the board tile by tile.
         assert k % 2 == 0, 'k must be even'
         self.k = k
         self.win_unility = 1.0
+        self.bitboard = bitboard
+
+        # Masks used by shift-based move generation. Shift by dr*k + dc moves every disc one
+        # tile in direction (dr, dc); discs that wrapped around to the other side of the board
+        # are removed by the mask.
+        self.full_mask = (1 << (k * k)) - 1
+        first_col = sum(1 << (r * k) for r in range(k))
+        last_col = first_col << (k - 1)
+        self.shifts = []
+        for dr, dc in self.directions:
+            mask = self.full_mask
+            if dc == 1:
+                mask &= ~first_col
+            elif dc == -1:
+                mask &= ~last_col
+            self.shifts.append((dr * k + dc, mask))
 
 
     def initial_state(self):
@@ -121,6 +255,8 @@ class Reversi(Game):
         board[h-1][h-1] = 'B'
         board[h-1][h] = 'w'
         board[h][h-1] = 'w'
+        if self.bitboard:
+            return self.board_to_bitboard_state(board, 'B')
         return {'player_at_turn': 'B',
                 'board': board}
 
@@ -153,6 +289,81 @@ class Reversi(Game):
         return divmod(n, self.k)
 
 
+    def board_to_bitboard_state(self, board, player_at_turn):
+        # Convert board (list of lists) to BitboardState
+        masks = {'B': 0, 'w': 0}
+        for r in range(self.k):
+            for c in range(self.k):
+                if board[r][c] != ' ':
+                    masks[board[r][c]] |= 1 << self.action_rc_to_number(r, c)
+        return BitboardState(self.k, masks, player_at_turn=player_at_turn)
+
+
+    def mask_to_actions(self, mask):
+        # List of action codes (set bits of mask) in ascending order
+        acts = []
+        while mask:
+            low = mask & -mask
+            acts.append(low.bit_length() - 1)
+            mask ^= low
+        return acts
+
+
+    def legal_moves_mask(self, own, opp):
+        # Mask of all valid moves of player with discs own against opponent with discs opp.
+        # In each direction grow runs of opponent`s discs starting next to own discs, a move is
+        # valid on empty tile right behind such run.
+        empty = self.full_mask & ~(own | opp)
+        moves = 0
+        for shift, mask in self.shifts:
+            if shift > 0:
+                run = (own << shift) & mask & opp
+                for _ in range(self.k - 3):
+                    run |= (run << shift) & mask & opp
+                moves |= (run << shift) & mask & empty
+            else:
+                run = (own >> -shift) & mask & opp
+                for _ in range(self.k - 3):
+                    run |= (run >> -shift) & mask & opp
+                moves |= (run >> -shift) & mask & empty
+        return moves
+
+
+    def flips_mask(self, own, opp, move):
+        # Mask of opponent`s discs flipped by placing own disc at action code move (0 if none)
+        flips = 0
+        for shift, mask in self.shifts:
+            run = 0
+            if shift > 0:
+                x = ((1 << move) << shift) & mask
+                while x & opp:
+                    run |= x
+                    x = (x << shift) & mask
+            else:
+                x = ((1 << move) >> -shift) & mask
+                while x & opp:
+                    run |= x
+                    x = (x >> -shift) & mask
+            if x & own:
+                flips |= run
+        return flips
+
+
+    def execute_bitboard_move(self, state, move):
+        # Same as execute_move, for BitboardState and move given as action code
+        player = state['player_at_turn']
+        other_player = self.other_player(player)
+        own, opp = state[player], state[other_player]
+        bit = 1 << move
+        if (own | opp) & bit:
+            return False, None  # not an empty tile
+        flips = self.flips_mask(own, opp, move)
+        if not flips:
+            return False, None
+        return True, BitboardState(self.k, {player: own | flips | bit, other_player: opp ^ flips},
+                                   player_at_turn=other_player)
+
+
     def execute_move(self, state, r, c, check_only=False):
         ### May be CPU-heavy
         # Place disc of player at turn at r,c tile and flip appropriate opponent`s discs.
@@ -208,21 +419,52 @@ class Reversi(Game):
 
 
     def actions(self, state):
+        # List of possible actions (action codes) for player at turn.
+        # Moves are generated once per state and cached in state['actions_cache'] together with
+        # the player they were generated for, so is_terminal and utility on the same state
+        # don`t generate them again.
+        player = state['player_at_turn']
+        cache = state.get('actions_cache')
+        if cache is None or cache[0] != player:
+            cache = (player, self.generate_actions(state))
+            state['actions_cache'] = cache
+        return list(cache[1])
+
+
+    def generate_actions(self, state):
         ### May be CPU-heavy
-        # List of possible actions (action codes) for player at turn
-        acts = []
+        # Generate all valid moves of player at turn in one sweep over the board.
+        player = state['player_at_turn']
+        other_player = self.other_player(player)
+        if self.bitboard:
+            return self.mask_to_actions(self.legal_moves_mask(state[player], state[other_player]))
+        # Only empty tiles next to opponent`s disc (frontier) can be valid moves, so only those
+        # are checked
+        board = state['board']
+        candidates = set()
         for r in range(self.k):
             for c in range(self.k):
-                valid_move, _ = self.execute_move(state, r, c, check_only=True)
-                if valid_move:
-                    acts.append(self.action_rc_to_number(r, c))
+                if board[r][c] != other_player:
+                    continue
+                for dr, dc in self.directions:
+                    rr, cc = r + dr, c + dc
+                    if 0 <= rr < self.k and 0 <= cc < self.k and board[rr][cc] == ' ':
+                        candidates.add(self.action_rc_to_number(rr, cc))
+        acts = []
+        for move in sorted(candidates):
+            valid_move, _ = self.execute_move(state, *self.action_number_to_rc(move), check_only=True)
+            if valid_move:
+                acts.append(move)
         return acts
 
 
     def state_after_move(self, state, move):
         ### May be CPU-heavy
         # Executes given action, returning state, or None if action was invalid 
-        valid_move, new_state = self.execute_move(state, *self.action_number_to_rc(move))
+        if self.bitboard:
+            valid_move, new_state = self.execute_bitboard_move(state, move)
+        else:
+            valid_move, new_state = self.execute_move(state, *self.action_number_to_rc(move))
         if not valid_move:
             print('Action {} is not possible for player "{}" in this state:'.format(move, self.player_at_turn(state)))
             self.display_state(state, show_nums=True)
@@ -230,18 +472,147 @@ class Reversi(Game):
         return new_state
 
 
+    def disc_masks(self, state, player):
+        # Occupancy masks (bit r*k + c for disc at [r, c]) of player and of his opponent
+        other_player = self.other_player(player)
+        if self.bitboard:
+            return state[player], state[other_player]
+        own, opp = 0, 0
+        bit = 1
+        for row in state['board']:
+            for ch in row:
+                if ch == player:
+                    own |= bit
+                elif ch == other_player:
+                    opp |= bit
+                bit <<= 1
+        return own, opp
+
+
+    def frontier_mask(self, own, opp):
+        # Discs of own which are next to an empty tile
+        empty = self.full_mask & ~(own | opp)
+        near_empty = 0
+        for shift, mask in self.shifts:
+            near_empty |= (empty << shift) & mask if shift > 0 else (empty >> -shift) & mask
+        return own & near_empty
+
+
+    def empty_count(self, state):
+        # Number of empty tiles on the board
+        if self.bitboard:
+            return self.k ** 2 - popcount(state['B'] | state['w'])
+        return sum(row.count(' ') for row in state['board'])
+
+
+    def copy_state(self, state):
+        # Copy of state which can be modified by make_move/undo_move without touching the original
+        if self.bitboard:
+            return BitboardState(self.k, {player: state[player] for player in self.players()},
+                                 player_at_turn=state['player_at_turn'])
+        return {'player_at_turn': state['player_at_turn'],
+                'board': [list(row) for row in state['board']]}
+
+
+    def flipped_discs(self, state, move):
+        # List of opponent`s discs (action codes) flipped if player at turn plays move
+        player = state['player_at_turn']
+        other_player = self.other_player(player)
+        if self.bitboard:
+            return self.mask_to_actions(self.flips_mask(state[player], state[other_player], move))
+        board = state['board']
+        r, c = self.action_number_to_rc(move)
+        flips = []
+        for dr, dc in self.directions:
+            rr, cc = r + dr, c + dc
+            run = []
+            while 0 <= rr < self.k and 0 <= cc < self.k and board[rr][cc] == other_player:
+                run.append(self.action_rc_to_number(rr, cc))
+                rr, cc = rr + dr, cc + dc
+            if run and 0 <= rr < self.k and 0 <= cc < self.k and board[rr][cc] == player:
+                flips.extend(run)
+        return flips
+
+
+    def make_move(self, state, move):
+        # Execute move in place - state is modified instead of creating new one. Flipped discs are
+        # recorded on undo stack (state['undo']), so the move can be taken back by undo_move.
+        # Returns list of flipped discs (action codes).
+        player = state['player_at_turn']
+        other_player = self.other_player(player)
+        if self.bitboard:
+            bit = 1 << move
+            flips = self.flips_mask(state[player], state[other_player], move)
+            if (state[player] | state[other_player]) & bit or not flips:
+                raise ValueError('Invalid move {}'.format(move))
+            state[player] |= flips | bit
+            state[other_player] ^= flips
+            flipped = self.mask_to_actions(flips)
+        else:
+            board = state['board']
+            r, c = self.action_number_to_rc(move)
+            flipped = self.flipped_discs(state, move) if board[r][c] == ' ' else []
+            if not flipped:
+                raise ValueError('Invalid move {}'.format(move))
+            for f in flipped:
+                rr, cc = self.action_number_to_rc(f)
+                board[rr][cc] = player
+            board[r][c] = player
+        state['player_at_turn'] = other_player
+        undo = state.get('undo')
+        if undo is None:
+            undo = state['undo'] = []
+        undo.append((move, flipped, state.pop('actions_cache', None)))
+        return flipped
+
+
+    def undo_move(self, state):
+        # Take back the last move executed by make_move on this state
+        move, flipped, actions_cache = state['undo'].pop()
+        other_player = state['player_at_turn']
+        player = self.other_player(other_player)
+        if self.bitboard:
+            flips = 0
+            for f in flipped:
+                flips |= 1 << f
+            state[player] &= ~(flips | (1 << move))
+            state[other_player] |= flips
+        else:
+            board = state['board']
+            for f in flipped:
+                rr, cc = self.action_number_to_rc(f)
+                board[rr][cc] = other_player
+            r, c = self.action_number_to_rc(move)
+            board[r][c] = ' '
+        state['player_at_turn'] = player
+        if actions_cache is None:
+            state.pop('actions_cache', None)
+        else:
+            state['actions_cache'] = actions_cache
+
+
     def is_terminal(self, state):
-        ### May be CPU-heavy
-        # Is this final state of the game?
+        # Is this final state of the game? (uses cached actions)
         return len(self.actions(state)) == 0
 
 
     def utility(self, state, player):
-        ### May be CPU-heavy
         if not self.is_terminal(state):
             return 0
-        board = state['board']
         other_player = self.other_player(player)
+        if self.bitboard:
+            num_my, num_opp = popcount(state[player]), popcount(state[other_player])
+        else:
+            num_my, num_opp = self.count_discs(state['board'], player, other_player)
+        if num_my > num_opp:
+            return self.win_unility
+        if num_my < num_opp:
+            return -self.win_unility
+        return 0
+
+
+    def count_discs(self, board, player, other_player):
+        # Number of discs of player and of other_player on board
         num_my, num_opp = 0, 0
         for r in range(self.k):
             for c in range(self.k):
@@ -249,11 +620,7 @@ class Reversi(Game):
                     num_my += 1
                 elif board[r][c] == other_player:
                     num_opp += 1
-        if num_my > num_opp:
-            return self.win_unility
-        if num_my < num_opp:
-            return -self.win_unility
-        return 0
+        return num_my, num_opp
 
 
     def display_state(self, state, show_nums=False):
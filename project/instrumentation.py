@@ -0,0 +1,165 @@
+import json
+from time import perf_counter
+
+
+# Methods of the game which are timed, grouped by what they do
+GAME_METHODS = {
+    'actions': 'move_generation',
+    'state_after_move': 'move_application',
+    'make_move': 'move_application',
+    'undo_move': 'move_application',
+    'is_terminal': 'terminal_check',
+    'utility': 'terminal_check',
+}
+# Methods of the player which are timed as evaluation
+PLAYER_METHODS = ['heuristic']
+
+
+class SearchStats:
+    # Counters collected by InstrumentedGame and InstrumentedPlayer: number of calls and time
+    # spent in every timed method, and number of moves returned by actions (branching factor).
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.times = {}
+        self.generated_moves = 0  # total length of lists returned by actions
+        self.expanded = 0  # number of actions calls which returned at least one move
+
+    def timed(self, name, function):
+        # function wrapped so that its calls and time are counted under name
+        function = getattr(function, 'original', function)  # don`t time already timed function twice
+
+        def wrapper(*args, **kwargs):
+            t = perf_counter()
+            result = function(*args, **kwargs)
+            self.times[name] = self.times.get(name, 0.0) + perf_counter() - t
+            self.calls[name] = self.calls.get(name, 0) + 1
+            return result
+        wrapper.original = function
+        return wrapper
+
+    def record_actions(self, actions):
+        if actions:
+            self.generated_moves += len(actions)
+            self.expanded += 1
+
+    def time_split(self):
+        # time spent in move generation, move application, terminal checks and evaluation
+        split = {}
+        for name, t in self.times.items():
+            group = GAME_METHODS.get(name, 'evaluation')
+            split[group] = split.get(group, 0.0) + t
+        return split
+
+
+class InstrumentedGame:
+    # Opt-in wrapper of a Game: behaves as the game itself, but counts and times calls of its
+    # methods (GAME_METHODS). play and play_n_games run the original code with this wrapper as
+    # the game, so every call of players is counted, and optionally save report to JSON file.
+    # Players are changed only during play.
+    def __init__(self, game, stats=None):
+        self.game = game
+        self.stats = stats or SearchStats()
+        self.moves = []  # per-move records of InstrumentedPlayers playing this game
+        for name in GAME_METHODS:
+            if hasattr(game, name):
+                setattr(self, name, self.stats.timed(name, getattr(game, name)))
+        timed_actions = getattr(self, 'actions')
+
+        def actions(state):
+            acts = timed_actions(state)
+            self.stats.record_actions(acts)
+            return acts
+        self.actions = actions
+
+    def __getattr__(self, name):
+        return getattr(self.game, name)
+
+    def __reduce__(self):
+        # timed methods are closures, they are created again (players keep the game they played,
+        # so the wrapper gets pickled with them)
+        return InstrumentedGame, (self.game, self.stats), {'moves': self.moves}
+
+    def play(self, players, *args, json_path=None, **kwargs):
+        return self.run(type(self.game).play, players, args, kwargs, json_path)
+
+    def play_n_games(self, players, n, *args, json_path=None, **kwargs):
+        return self.run(type(self.game).play_n_games, players, (n,) + args, kwargs, json_path)
+
+    def run(self, play, players, args, kwargs, json_path):
+        # play with players wrapped in InstrumentedPlayers; players wrapped here get their methods
+        # back afterwards, so they stay usable (and picklable) outside of instrumentation
+        wrapped = [p if isinstance(p, InstrumentedPlayer) else InstrumentedPlayer(p, self) for p in players]
+        try:
+            result = play(self, wrapped, *args, **kwargs)
+        finally:
+            for p, original in zip(wrapped, players):
+                if p is not original:
+                    p.restore()
+        if json_path is not None:
+            self.save(json_path)
+        return result
+
+    def report(self):
+        # Summary of all recorded moves: per player totals and list of per-move records
+        summary = {}
+        for move in self.moves:
+            s = summary.setdefault(move['player'], {'moves': 0, 'time': 0.0, 'nodes': 0})
+            s['moves'] += 1
+            s['time'] += move['time']
+            s['nodes'] += move['nodes']
+        for s in summary.values():
+            s['nodes_per_sec'] = s['nodes'] / s['time'] if s['time'] else 0.0
+        return {'summary': summary, 'moves': self.moves}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+
+class InstrumentedPlayer:
+    # Wraps a player: every choose_move is timed and a record of the move is added to game.moves -
+    # nodes searched and nodes/sec (if the player counts nodes, like MyPlayer), branching factor,
+    # cutoffs by depth (if the player counts them), calls of game methods and time split between
+    # move generation, move application, terminal checks and evaluation.
+    def __init__(self, player, game):
+        self.player = player
+        self.game = game
+        self.name = type(player).__name__
+        self.hidden = {}  # timed method -> player`s own instance attribute it hides (None if none)
+        for name in PLAYER_METHODS:
+            if hasattr(player, name):
+                # instance attribute hides the method, so the player`s own calls are timed too
+                self.hidden[name] = vars(player).get(name)
+                setattr(player, name, game.stats.timed(name, getattr(player, name)))
+
+    def restore(self):
+        # remove timed methods from the player
+        for name, attribute in self.hidden.items():
+            if attribute is None:
+                delattr(self.player, name)
+            else:
+                setattr(self.player, name, attribute)
+        self.hidden = {}
+
+    def choose_move(self, game, state):
+        stats = self.game.stats
+        stats.reset()
+        t = perf_counter()
+        move = self.player.choose_move(game, state)
+        t = perf_counter() - t
+        nodes = getattr(self.player, 'nodes', 0)
+        cutoffs = getattr(self.player, 'cutoffs', {})
+        self.game.moves.append({
+            'player': '{} ({})'.format(self.name, game.player_at_turn(state)),
+            'time': t,
+            'nodes': nodes,
+            'nodes_per_sec': nodes / t if t else 0.0,
+            'branching_factor': stats.generated_moves / stats.expanded if stats.expanded else 0.0,
+            'cutoffs_by_depth': {str(d): n for d, n in sorted(cutoffs.items())},
+            'calls': dict(stats.calls),
+            'time_split': stats.time_split(),
+        })
+        return move
@@ -0,0 +1,183 @@
+import math
+import random
+from time import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Monte Carlo Tree Search (UCT) player. It uses only the Game interface (actions,
+# state_after_move, is_terminal, utility, player_at_turn, players), so it plays Reversi as well as
+# TicTacToe and Gomoku of the other directories. If the game has candidate_moves (TicTacToe
+# family), only those are searched and played in rollouts.
+
+
+class Node:
+    __slots__ = ('parent', 'move', 'state', 'player', 'moves', 'children', 'visits', 'reward')
+
+    def __init__(self, parent, move, state, player, moves):
+        self.parent = parent
+        self.move = move  # move which led to this node
+        self.state = state
+        self.player = player  # player who made the move, reward is his
+        self.moves = moves  # moves not expanded yet
+        self.children = []
+        self.visits = 0
+        self.reward = 0.0
+
+
+def state_key(game, state):
+    # Key identifying state, used to find the state of the game in the tree kept from the last move
+    try:
+        hash(state)
+        return state
+    except TypeError:
+        return game.player_at_turn(state), repr(state['board'])
+
+
+def moves_of(game, state):
+    if game.is_terminal(state):
+        return []
+    if hasattr(game, 'candidate_moves'):
+        return game.candidate_moves(state)
+    return game.actions(state)
+
+
+def rollout(game, state, rnd):
+    # Play random moves till the end of game, returns utility of the first player
+    while not game.is_terminal(state):
+        state = game.state_after_move(state, rnd.choice(moves_of(game, state)))
+    return game.utility(state, game.players()[0])
+
+
+worker_game = None
+
+
+def rollout_worker_init(game):
+    global worker_game
+    worker_game = game
+
+
+def rollout_task(task):
+    # Rollout in worker process
+    state, seed = task
+    return rollout(worker_game, state, random.Random(seed))
+
+
+class MCTSPlayer:
+    # time_limit: seconds per move, iterations: max number of rollouts per move (None - only time
+    # limits the search), exploration: UCT constant. With workers > 1 leaves are selected in
+    # batches of batch_size (every selected path gets a virtual loss, so the batch spreads over
+    # the tree) and their rollouts run in worker processes. seed None means the module random is
+    # used, so random.seed (e.g. per game of play_tournament) controls the rollouts.
+    def __init__(self, time_limit=1.0, iterations=None, exploration=1.4, workers=1, batch_size=16,
+                 seed=None):
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.exploration = exploration
+        self.workers = workers
+        self.batch_size = batch_size if workers > 1 else 1
+        self.rnd = random.Random(seed) if seed is not None else random
+        self.root = None
+        self.pool = None
+        self.pool_game = None
+        self.rollouts = 0  # rollouts of the last choose_move
+        self.reused = 0  # visits of the root kept from the previous move
+
+    def __getstate__(self):
+        # process pool can`t be pickled (e.g. when player is sent to another process), neither can
+        # module random
+        state = self.__dict__.copy()
+        state.update(pool=None, pool_game=None, root=None)
+        if self.rnd is random:
+            state['rnd'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.rnd is None:
+            self.rnd = random
+
+    # shut down worker processes
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    # node of state - subtree of the last root if the state is in its first two levels (after own
+    # move and opponent`s answer), otherwise new tree
+    def find_root(self, game, state):
+        key = state_key(game, state)
+        if self.root is not None:
+            level = [self.root]
+            for _ in range(2):
+                level = [child for node in level for child in node.children]
+                for node in level:
+                    if state_key(game, node.state) == key:
+                        node.parent = None
+                        return node
+        return Node(None, None, state, None, moves_of(game, state))
+
+    def choose_move(self, game, state):
+        deadline = time() + self.time_limit
+        root = self.root = self.find_root(game, state)
+        self.reused = root.visits
+        self.rollouts = 0
+        first = game.players()[0]
+        while True:
+            batch = [self.select(game, root) for _ in range(self.batch_size)]
+            for leaf, utility in zip(batch, self.simulate(game, [leaf.state for leaf in batch])):
+                self.backpropagate(leaf, utility, first)
+            self.rollouts += len(batch)
+            if time() > deadline or (self.iterations is not None and self.rollouts >= self.iterations):
+                break
+            if not root.moves and len(root.children) == 1:
+                break  # only one possible move
+        best = max(root.children, key=lambda child: child.visits)
+        return best.move
+
+    # Walk down the tree by UCT to a node with unexpanded moves (or terminal one) and expand it.
+    # Visits are counted already on the way down, which works as virtual loss for the batch.
+    def select(self, game, node):
+        node.visits += 1
+        while not node.moves and node.children:
+            log_visits = math.log(node.visits)
+            node = max(node.children, key=lambda child: child.reward / child.visits +
+                       self.exploration * math.sqrt(log_visits / child.visits) if child.visits else math.inf)
+            node.visits += 1
+        if node.moves:
+            move = node.moves.pop(self.rnd.randrange(len(node.moves)))
+            state = game.state_after_move(node.state, move)
+            child = Node(node, move, state, game.player_at_turn(node.state), moves_of(game, state))
+            node.children.append(child)
+            child.visits += 1
+            node = child
+        return node
+
+    # Rollouts from given states, utilities of the first player
+    def simulate(self, game, states):
+        if self.workers <= 1:
+            return [rollout(game, state, self.rnd) for state in states]
+        if self.pool is None or self.pool_game is not game:
+            self.close()
+            self.pool = ProcessPoolExecutor(self.workers, initializer=rollout_worker_init, initargs=(game,))
+            self.pool_game = game
+        tasks = [(state, self.rnd.getrandbits(32)) for state in states]
+        return list(self.pool.map(rollout_task, tasks, chunksize=max(1, len(tasks) // self.workers)))
+
+    def backpropagate(self, node, utility, first):
+        # reward 1 for win, 0.5 for draw, 0 for loss of the player who made the move
+        while node is not None:
+            if node.player is not None:
+                u = utility if node.player == first else -utility
+                node.reward += 1.0 if u > 0 else 0.5 if u == 0 else 0.0
+            node = node.parent
+
+
+if __name__ == '__main__':
+    from games import Reversi
+    from minimax import MyPlayer
+
+    ## MCTS against MyPlayer in Reversi
+    print(Reversi(bitboard=True).play_tournament([MCTSPlayer(time_limit=1.0), MyPlayer()], n=10, workers=1))
+    ## Gomoku from directory 1, rollouts in 4 processes
+    # from benchmark import load_games_module
+    # print(load_games_module().Gomoku().play_tournament([MCTSPlayer(time_limit=2.0, workers=4), MCTSPlayer(time_limit=2.0)], n=2))
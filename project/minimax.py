@@ -1,6 +1,10 @@
 import sys
 import random
-from games import Reversi
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+from games import Reversi, TIME_LIMIT, popcount
+from opening_book import OpeningBook
 
 infinity = 0
 try:
@@ -34,86 +38,652 @@ class RandomPlayer(Player):
         return random.choice(game.actions(state))
 
 
+def square_weights(k, corner=6, edge=3, inner=1, c_square=None, x_square=None):
+    # Positional weight of every tile (index = action code) of k x k board. C squares are edge
+    # tiles next to a corner, X squares are diagonal neighbours of corners; by default they have
+    # the same weight as other edge / inner tiles. Default weights give the same score as the
+    # original edge/corner heuristic with coefficient 3.
+    c_square = edge if c_square is None else c_square
+    x_square = inner if x_square is None else x_square
+    weights = []
+    for r in range(k):
+        for c in range(k):
+            on_edge_r, on_edge_c = r in (0, k - 1), c in (0, k - 1)
+            near_r, near_c = r in (1, k - 2), c in (1, k - 2)
+            if on_edge_r and on_edge_c:
+                weights.append(corner)
+            elif (on_edge_r and near_c) or (on_edge_c and near_r):
+                weights.append(c_square)
+            elif near_r and near_c:
+                weights.append(x_square)
+            elif on_edge_r or on_edge_c:
+                weights.append(edge)
+            else:
+                weights.append(inner)
+    return weights
+
+
+def weight_masks(weights):
+    # Group tiles with the same weight into one mask - list of (weight, mask) pairs, so score of
+    # a board is a few popcounts instead of a loop over all tiles
+    masks = {}
+    for i, w in enumerate(weights):
+        masks[w] = masks.get(w, 0) | (1 << i)
+    return [(w, mask) for w, mask in masks.items() if w != 0]
+
+
+# Flags of transposition table entries - stored value is exact, lower bound or upper bound
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class Zobrist:
+    # Random 64-bit key for every (player, tile) pair and for the second player being at turn.
+    # Hash of a state is XOR of keys of all discs on the board, so it can be updated after a move
+    # by XOR-ing only keys of placed and flipped discs.
+    def __init__(self, game, seed=2021):
+        rnd = random.Random(seed)
+        self.tiles = {p: [rnd.getrandbits(64) for _ in range(game.k ** 2)] for p in game.players()}
+        self.side = rnd.getrandbits(64)
+        self.second = game.players()[1]
+
+    def hash(self, game, state):
+        # compute hash of state from scratch
+        board = state['board']
+        h = self.side if game.player_at_turn(state) == self.second else 0
+        for r in range(game.k):
+            for c in range(game.k):
+                if board[r][c] != ' ':
+                    h ^= self.tiles[board[r][c]][game.action_rc_to_number(r, c)]
+        return h
+
+    def after_move(self, h, player, other_player, move, flipped):
+        # hash of state after player placed disc at move and flipped discs in flipped
+        h ^= self.side ^ self.tiles[player][move]
+        mine, opp = self.tiles[player], self.tiles[other_player]
+        for f in flipped:
+            h ^= mine[f] ^ opp[f]
+        return h
+
+
+class TranspositionTable:
+    # Fixed size table of already searched positions indexed by Zobrist hash. Every slot keeps one
+    # entry (key, depth, value, flag, best move, generation). Deeper results replace shallower
+    # ones, entries from older searches (generations) are always replaced.
+    def __init__(self, size):
+        self.size = size
+        self.slots = [None] * size
+        self.generation = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.probes = 0
+        self.hits = 0
+        self.cutoffs = 0
+        self.stores = 0
+
+    def new_search(self):
+        self.generation += 1
+        self.reset_counters()
+
+    def lookup(self, key):
+        self.probes += 1
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, value, flag, move):
+        i = key % self.size
+        entry = self.slots[i]
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.slots[i] = (key, depth, value, flag, move, self.generation)
+            self.stores += 1
+
+    def stats(self):
+        return tt_stats(self.probes, self.hits, self.cutoffs, self.stores)
+
+
+def tt_stats(probes, hits, cutoffs, stores):
+    return {'probes': probes,
+            'hits': hits,
+            'cutoffs': cutoffs,
+            'stores': stores,
+            'hit_rate': hits / probes if probes else 0.0}
+
+
+def sum_tt_stats(stats):
+    # statistics of several tables (e.g. of worker processes) together
+    return tt_stats(*(sum(s[name] for s in stats) for name in ('probes', 'hits', 'cutoffs', 'stores')))
+
+
+class SearchTimeout(Exception):
+    # Raised from inside of the search when time for the move is over
+    pass
+
+
 class MyPlayer(Player):
-    def __init__(self):
-        self.depth = 3
+    def __init__(self, depth=3, in_place=True, tt_size=1 << 16, time_fraction=None,
+                 ordering=True, pvs=False, weights=None, mobility_weight=0, frontier_weight=0,
+                 workers=1, endgame_empties=10, book=None, evaluation=None):
+        self.depth = depth
         self.game = None
         self.my_player = ""
+        # in_place: search with game.make_move/undo_move on one copy of the state instead of
+        # creating new state after every move
+        self.in_place = in_place
+        # tt_size: number of transposition table slots, 0 turns the table off
+        self.tt_size = tt_size
+        self.tt = None
+        self.zobrist = None
+        self.hash = 0  # Zobrist hash of the state being searched
+        self.hashes = []  # hashes of states on the path from the root, for revert
+        self.nodes = 0
+        self.tt_stats = {}  # transposition table counters of the last choose_move
+        # time_fraction: if set, search with iterative deepening (depth 0, 1, 2...) until this
+        # fraction of TIME_LIMIT is used, instead of fixed self.depth
+        self.time_fraction = time_fraction
+        self.deadline = None
+        self.completed_depth = None  # depth of the last completed search
+        # ordering: search hash move, corners, killer moves and moves with good history first
+        # pvs: principal variation search - only first move gets full (alpha, beta) window, the
+        # others are first searched with null window just to prove they are not better
+        self.ordering = ordering
+        self.pvs = pvs
+        self.ply = 0  # distance of the searched state from the root
+        self.killers = {}  # ply -> last two moves which caused cutoff in that ply
+        self.history = {}  # player -> how often (weighted by depth) each move caused cutoff
+        self.cutoffs = {}  # ply -> number of cutoffs, for node count reports
+        self.corners = set()
+        # weights: positional weight of every tile (see square_weights), mobility_weight and
+        # frontier_weight: weight of difference in number of valid moves and in number of
+        # frontier discs (discs next to empty tile) of the player and his opponent
+        self.weights = weights
+        self.weight_masks = []
+        self.mobility_weight = mobility_weight
+        self.frontier_weight = frontier_weight
+        # workers: number of processes searching root moves in parallel (fixed depth search only)
+        self.workers = workers
+        self.pool = None
+        self.pool_game = None
+        self.shared_alpha = None
+        # endgame_empties: when there are at most this many empty tiles, the rest of the game is
+        # searched exactly (maximizing final disc difference) instead of using heuristic
+        self.endgame_empties = endgame_empties
+        self.endgame_value = None  # final disc difference found by the last endgame search
+        self.regions = []  # quadrants of the board, for parity move ordering in endgame
+        # book: opening book (OpeningBook or path to file made by opening_book.py), positions
+        # found in the book are not searched at all
+        self.book = OpeningBook(book) if isinstance(book, str) else book
+        # evaluation: learned pattern evaluation (PatternEvaluation or path to file made by
+        # patterns.py) used instead of positional weights
+        if isinstance(evaluation, str):
+            from patterns import PatternEvaluation  # needs numpy only when it is used
+            evaluation = PatternEvaluation(evaluation)
+        self.evaluation = evaluation
+
+    def __getstate__(self):
+        # process pool can`t be pickled (e.g. when player is sent to another process)
+        state = self.__dict__.copy()
+        state.update(pool=None, pool_game=None, shared_alpha=None)
+        return state
+
+    # settings of the player, used to create the same player in worker processes
+    def settings(self):
+        return {'depth': self.depth, 'in_place': self.in_place, 'tt_size': self.tt_size,
+                'ordering': self.ordering, 'pvs': self.pvs, 'weights': self.weights,
+                'mobility_weight': self.mobility_weight, 'frontier_weight': self.frontier_weight,
+                'evaluation': self.evaluation}
 
     def choose_move(self, game, state):
+        if self.book is not None:
+            move = self.book.lookup(game, state)
+            if move is not None and move in game.actions(state):
+                return move
+        # one deadline for the whole move, endgame search and iterative deepening share it
+        start = time()
+        budget = (self.time_fraction or 1.0) * TIME_LIMIT
+        state = self.prepare(game, state)
+        self.endgame_value = None
+        if self.endgame_empties and game.empty_count(state) <= self.endgame_empties:
+            # endgame search gets half of the time, if it doesn`t finish normal search is used
+            self.deadline = start + 0.5 * budget
+            try:
+                best_turn, self.endgame_value = self.solve_endgame(state)
+            except SearchTimeout:
+                pass
+        parallel = False
+        if self.endgame_value is not None:
+            pass  # solved exactly
+        elif self.time_fraction is None:
+            self.deadline = None
+            if self.workers > 1:
+                parallel = True  # tt_stats are set from tables of workers
+                best_turn, _ = self.parallel_search_root(state, self.depth)
+            else:
+                best_turn, _ = self.search_root(state, self.depth)
+            self.completed_depth = self.depth
+        else:
+            best_turn = self.iterative_deepening(state, start + budget)
+        if self.tt is not None and not parallel:
+            self.tt_stats = self.tt.stats()
+        return best_turn
+
+    # set up player for searching state of game, returns state the search works with
+    def prepare(self, game, state):
         # set up self game  and self my player
+        if self.game is not game or self.my_player != game.player_at_turn(state):
+            # stored values are valid only for the same game and the same side
+            self.tt = TranspositionTable(self.tt_size) if self.tt_size else None
+            self.zobrist = Zobrist(game) if self.tt_size else None
+        if self.game is not game:
+            self.history = {p: [0] * game.k ** 2 for p in game.players()}
+            self.corners = {0, game.k - 1, game.k * (game.k - 1), game.k ** 2 - 1}
+            self.weight_masks = weight_masks(self.weights or square_weights(game.k))
+            h = game.k // 2
+            quadrant = sum(1 << game.action_rc_to_number(r, c) for r in range(h) for c in range(h))
+            self.regions = [quadrant, quadrant << h, quadrant << (h * game.k), quadrant << (h * game.k + h)]
         self.game = game
         self.my_player = game.player_at_turn(state)
+        if self.in_place:
+            state = game.copy_state(state)  # search must not modify state of the real game
+        self.nodes = 0
+        self.hashes = []
+        self.ply = 0
+        self.killers = {}
+        self.cutoffs = {}
+        for history in self.history.values():  # old cutoffs are getting less relevant
+            for i in range(len(history)):
+                history[i] //= 2
+        if self.tt is not None:
+            self.tt.new_search()
+            self.hash = self.zobrist.hash(game, state)
+        return state
+
+    # search depth 0, 1, 2... and return best move of the last search that finished before deadline
+    def iterative_deepening(self, state, deadline):
+        self.deadline = deadline
+        best_turn = self.game.actions(state)[0]
+        self.completed_depth = None
+        # deeper search than number of empty tiles can`t find anything new
+        for depth in range(self.game.empty_count(state)):
+            try:
+                best_turn, _ = self.search_root(state, depth, best_turn)
+            except SearchTimeout:
+                break
+            self.completed_depth = depth
+        return best_turn
 
+    # max part of the search for the root state, returns (best move, its value); first is move
+    # which is searched first (e.g. best move of previous iteration)
+    def search_root(self, state, depth, first=None):
         # starting as max finding best move
         alpha = best_value = -infinity
         best_turn = None
-        for action in game.actions(state):
-            state_after = game.state_after_move(state, action)
-            value = self.min(state_after, alpha, infinity, self.depth)
+        actions = self.root_moves(state, first)
+        for i, action in enumerate(actions):
+            state_after = self.apply(state, action)
+            value = self.search_child(self.min, state_after, alpha, infinity, depth, i == 0, True)
+            self.revert(state)
             alpha = max(alpha, value)
             if value > best_value:
                 best_value = value
                 best_turn = action
-        return best_turn
+        return best_turn, best_value
+
+    # moves of the root state in order in which they are searched: first, then (with ordering)
+    # corners. Root order doesn`t depend on history, so parallel search breaks ties the same way.
+    def root_moves(self, state, first=None):
+        actions = self.game.actions(state)
+        if self.ordering:
+            return sorted(actions, reverse=True, key=lambda a: (a == first, a in self.corners))
+        if first in actions:
+            actions.remove(first)
+            actions.insert(0, first)
+        return actions
+
+    # same as search_root, but root moves are searched in worker processes. Workers share the best
+    # value found so far (alpha) and search with alpha lowered by 1, so every move at least as
+    # good as the best one gets exact value and the first best move in root order is chosen -
+    # the same move as serial search.
+    def parallel_search_root(self, state, depth):
+        if self.pool is None or self.pool_game is not self.game:
+            self.close()
+            self.shared_alpha = multiprocessing.Value('d', -infinity)
+            self.pool = ProcessPoolExecutor(self.workers, initializer=parallel_worker_init,
+                                            initargs=(self.settings(), self.game, self.shared_alpha))
+            self.pool_game = self.game
+        self.shared_alpha.value = -infinity
+        actions = self.root_moves(state)
+        tasks = [(state, action, depth) for action in actions]
+        best_value = -infinity
+        best_turn = None
+        stats = []
+        for action, (value, nodes, move_stats) in zip(actions, self.pool.map(parallel_search_move, tasks)):
+            self.nodes += nodes
+            stats.append(move_stats)
+            if value > best_value:
+                best_value = value
+                best_turn = action
+        if self.tt is not None:
+            self.tt_stats = sum_tt_stats(stats)
+        return best_turn, best_value
+
+    # shut down worker processes of parallel search
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    # exact search of the rest of the game, returns (best move, final disc difference) for player
+    # at turn. Works directly with occupancy masks of both players.
+    def solve_endgame(self, state):
+        own, opp = self.game.disc_masks(state, self.my_player)
+        alpha = best_value = -infinity
+        best_turn = None
+        for action, child_own, child_opp in self.endgame_moves(own, opp):
+            value = -self.endgame_search(child_own, child_opp, -infinity, -alpha)
+            if value > best_value:
+                best_value = value
+                best_turn = action
+                alpha = max(alpha, value)
+        return best_turn, best_value
+
+    # negamax with alpha-beta, value is final disc difference of player with discs own (at turn)
+    def endgame_search(self, own, opp, alpha, beta):
+        self.nodes += 1
+        self.check_time()
+        children = self.endgame_moves(own, opp)
+        if not children:  # game ends when player at turn can`t move
+            return popcount(own) - popcount(opp)
+        best_val = -infinity
+        for action, child_own, child_opp in children:
+            value = -self.endgame_search(child_own, child_opp, -beta, -alpha)
+            if value > best_val:
+                best_val = value
+                alpha = max(alpha, value)
+                if beta <= alpha:
+                    break
+        return best_val
+
+    # valid moves of player with discs own as list of (move, own of child, opp of child) - the
+    # child is seen from the opponent`s side. Moves into regions with odd number of empty tiles
+    # (parity) go first, then moves leaving the opponent fewest replies (fastest-first).
+    def endgame_moves(self, own, opp):
+        game = self.game
+        moves = game.legal_moves_mask(own, opp)
+        if not moves:
+            return []
+        empty = game.full_mask & ~(own | opp)
+        odd = 0
+        for region in self.regions:
+            if popcount(empty & region) & 1:
+                odd |= region
+        fastest_first = popcount(empty) > 4  # near the end ordering costs more than it saves
+        children = []
+        for action in game.mask_to_actions(moves):
+            bit = 1 << action
+            flips = game.flips_mask(own, opp, action)
+            child_own, child_opp = opp ^ flips, own | flips | bit
+            replies = popcount(game.legal_moves_mask(child_own, child_opp)) if fastest_first else 0
+            children.append((not bit & odd, replies, action, child_own, child_opp))
+        children.sort()
+        return [child[2:] for child in children]
+
+    # search child state by search (self.min or self.max); maximizing tells whether the parent is
+    # max node. With PVS every move except the first one is searched with null window first and
+    # searched again with full window only if it turns out to be better.
+    def search_child(self, search, state, alpha, beta, depth, first, maximizing):
+        if not self.pvs or first:
+            return search(state, alpha, beta, depth)
+        if maximizing:
+            value = search(state, alpha, alpha + 1, depth)
+        else:
+            value = search(state, beta - 1, beta, depth)
+        if alpha < value < beta:
+            value = search(state, alpha, beta, depth)
+        return value
+
+    # actions sorted so that the most promising moves are searched first: hash move (best move
+    # stored in transposition table), corners, killer moves of this ply and then by history
+    def order_moves(self, actions, player, hash_move):
+        killers = self.killers.get(self.ply, ())
+        history = self.history[player]
+        corners = self.corners
+        return sorted(actions, reverse=True,
+                      key=lambda a: (a == hash_move, a in corners, a in killers, history[a]))
+
+    # remember move which caused cutoff at the current ply
+    def record_cutoff(self, player, action, depth):
+        self.cutoffs[self.ply] = self.cutoffs.get(self.ply, 0) + 1
+        if self.ordering:
+            killers = self.killers.setdefault(self.ply, [])
+            if action not in killers:
+                killers.insert(0, action)
+                del killers[2:]
+            self.history[player][action] += depth * depth
+
+    # raise SearchTimeout if time for the move is over (checked only every 256 nodes)
+    def check_time(self):
+        if self.deadline is not None and self.nodes & 255 == 0 and time() > self.deadline:
+            raise SearchTimeout()
+
+    # state after action, with in_place search it is the same (modified) state
+    def apply(self, state, action):
+        player = self.game.player_at_turn(state)
+        if self.in_place:
+            flipped = self.game.make_move(state, action)
+            state_after = state
+        else:
+            flipped = self.game.flipped_discs(state, action) if self.tt is not None else None
+            state_after = self.game.state_after_move(state, action)
+        self.ply += 1
+        if self.tt is not None:
+            self.hashes.append(self.hash)
+            self.hash = self.zobrist.after_move(self.hash, player, self.game.other_player(player),
+                                                action, flipped)
+        return state_after
+
+    # take back action done by apply
+    def revert(self, state):
+        if self.in_place:
+            self.game.undo_move(state)
+        self.ply -= 1
+        if self.tt is not None:
+            self.hash = self.hashes.pop()
+
+    # look up searched state in transposition table, returns (value, alpha, beta, best move) with
+    # value not None if stored result is good enough to be returned without searching
+    def probe(self, depth, alpha, beta):
+        entry = self.tt.lookup(self.hash)
+        if entry is None:
+            return None, alpha, beta, None
+        if entry[1] < depth:
+            return None, alpha, beta, entry[4]
+        value, flag = entry[2], entry[3]
+        if flag == LOWER:
+            alpha = max(alpha, value)
+        elif flag == UPPER:
+            beta = min(beta, value)
+        if flag == EXACT or beta <= alpha:
+            self.tt.cutoffs += 1
+            return value, alpha, beta, entry[4]
+        return None, alpha, beta, entry[4]
+
+    # store result of search with original bounds alpha, beta into transposition table
+    def record(self, depth, value, alpha, beta, move):
+        if value <= alpha:
+            flag = UPPER
+        elif value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(self.hash, depth, value, flag, move)
 
     # heuristic to estimate result for specific player
-    def heuristic(self, state, player, coefficient=3):
-        board = state['board']
-        good = 0  # good tiles are those that are those in the corner or on the edge
-        total = 0
-        for r in range(len(board)):
-            for c in range(len(board[r])):
-                if board[r][c] == player:
-                    if r in [0, len(board) - 1] and c in [0, len(board[0]) - 1]:  # corner
-                        good += 2
-                        continue
-                    if r in [0, len(board) - 1]:  # only one edge
-                        good += 1
-                        continue
-                    if c in [0, len(board[0]) - 1]:  # only one edge
-                        good += 1
-                        continue
-                    total += 1
-
-        result = total + good * coefficient
+    def heuristic(self, state, player):
+        own, opp = self.game.disc_masks(state, player)
+        result = 0
+        if self.evaluation is not None:
+            result = self.evaluation(own, opp)
+        else:
+            for weight, mask in self.weight_masks:
+                result += weight * popcount(own & mask)
+        if self.mobility_weight:
+            result += self.mobility_weight * (popcount(self.game.legal_moves_mask(own, opp)) -
+                                              popcount(self.game.legal_moves_mask(opp, own)))
+        if self.frontier_weight:
+            result += self.frontier_weight * (popcount(self.game.frontier_mask(own, opp)) -
+                                              popcount(self.game.frontier_mask(opp, own)))
         return result if player == self.my_player else -result
 
     # max part of mini-max algorithm
     def max(self, state, alpha, beta, depth):
+        self.nodes += 1
+        self.check_time()
         if depth == 0:  # when we reach specific depth we will predict result
             return self.heuristic(state, self.my_player)
         best_val = -infinity
         actions = self.game.actions(state)
         if len(actions) == 0:  # when there is no more moves we return actual result
             return self.heuristic(state, self.my_player)
-        for action in actions:
-            state_after = self.game.state_after_move(state, action)
-            value = self.min(state_after, alpha, beta, depth - 1)
-            best_val = max(best_val, value)
+        alpha_orig, beta_orig = alpha, beta
+        hash_move = None
+        if self.tt is not None:
+            value, alpha, beta, hash_move = self.probe(depth, alpha, beta)
+            if value is not None:
+                return value
+        if self.ordering:
+            actions = self.order_moves(actions, self.my_player, hash_move)
+        best_action = None
+        for i, action in enumerate(actions):
+            state_after = self.apply(state, action)
+            value = self.search_child(self.min, state_after, alpha, beta, depth - 1, i == 0, True)
+            self.revert(state)
+            if value > best_val:
+                best_val = value
+                best_action = action
             alpha = max(alpha, best_val)
             if beta <= alpha:
+                self.record_cutoff(self.my_player, action, depth)
                 break
+        if self.tt is not None:
+            self.record(depth, best_val, alpha_orig, beta_orig, best_action)
         return best_val
 
     # min part of mini-max algorithm
     def min(self, state, alpha, beta, depth):
+        self.nodes += 1
+        self.check_time()
         if depth == 0:  # when we reach specific depth we will predict result
             return self.heuristic(state, self.game.other_player(self.my_player))
         best_val = infinity
         actions = self.game.actions(state)
         if len(actions) == 0:  # when there is no more moves we return actual result
             return self.heuristic(state, self.game.other_player(self.my_player))
-        for action in actions:
-            state_after = self.game.state_after_move(state, action)
-            value = self.max(state_after, alpha, beta, depth - 1)
-            best_val = min(best_val, value)
+        alpha_orig, beta_orig = alpha, beta
+        hash_move = None
+        if self.tt is not None:
+            value, alpha, beta, hash_move = self.probe(depth, alpha, beta)
+            if value is not None:
+                return value
+        if self.ordering:
+            actions = self.order_moves(actions, self.game.other_player(self.my_player), hash_move)
+        best_action = None
+        for i, action in enumerate(actions):
+            state_after = self.apply(state, action)
+            value = self.search_child(self.max, state_after, alpha, beta, depth - 1, i == 0, False)
+            self.revert(state)
+            if value < best_val:
+                best_val = value
+                best_action = action
             beta = min(beta, best_val)
             if beta <= alpha:
+                self.record_cutoff(self.game.other_player(self.my_player), action, depth)
                 break
+        if self.tt is not None:
+            self.record(depth, best_val, alpha_orig, beta_orig, best_action)
         return best_val
 
 
+# Player and game of worker process of parallel search, and the best value found at the root by
+# any worker (shared between processes)
+worker_player = None
+worker_game = None
+worker_alpha = None
+
+
+def parallel_worker_init(settings, game, shared_alpha):
+    global worker_player, worker_game, worker_alpha
+    worker_player = MyPlayer(**settings)
+    worker_game = game
+    worker_alpha = shared_alpha
+
+
+def parallel_search_move(task):
+    # Search one root move in worker process, returns (value, number of searched nodes, statistics
+    # of the worker`s transposition table for this move)
+    state, action, depth = task
+    state = worker_player.prepare(worker_game, state)
+    alpha = worker_alpha.value - 1
+    value = worker_player.min(worker_player.apply(state, action), alpha, infinity, depth)
+    if value > alpha:  # value is exact, not just upper bound
+        with worker_alpha.get_lock():
+            if value > worker_alpha.value:
+                worker_alpha.value = value
+    tt = worker_player.tt
+    return value, worker_player.nodes, tt.stats() if tt is not None else tt_stats(0, 0, 0, 0)
+
+
+def parallel_speedup_report(game, positions, depth, worker_counts=(2, 4, 8)):
+    # Print time of fixed depth search on given positions with serial and parallel search and
+    # check that parallel search chooses the same moves
+    serial = MyPlayer(depth=depth)
+    t = time()
+    moves = [serial.choose_move(game, state) for state in positions]
+    serial_time = time() - t
+    print('serial: {:.2f}s'.format(serial_time))
+    for workers in worker_counts:
+        player = MyPlayer(depth=depth, workers=workers)
+        t = time()
+        parallel_moves = [player.choose_move(game, state) for state in positions]
+        t = time() - t
+        player.close()
+        print('{} workers: {:.2f}s, speedup {:.2f}x, same moves: {}'
+              .format(workers, t, serial_time / t, parallel_moves == moves))
+
+def random_positions(game, n, plies, seed=0):
+    # n reproducible positions, each reached from the initial state by plies random moves
+    rnd = random.Random(seed)
+    positions = []
+    while len(positions) < n:
+        state = game.initial_state()
+        for _ in range(plies):
+            if game.is_terminal(state):
+                break
+            state = game.state_after_move(state, rnd.choice(game.actions(state)))
+        if not game.is_terminal(state):
+            positions.append(state)
+    return positions
+
+
+def node_count_report(game, positions, players):
+    # Print how many nodes each player (players is dict name -> MyPlayer) searched to choose move
+    # in given positions, e.g. to compare pruning with and without move ordering or PVS
+    totals = {}
+    for i, state in enumerate(positions):
+        row = []
+        for name, player in players.items():
+            t = time()
+            move = player.choose_move(game, state)
+            t = time() - t
+            totals[name] = [a + b for a, b in zip(totals.get(name, [0, 0]), [player.nodes, t])]
+            row.append('{}: {} nodes, move {}, {:.2f}s'.format(name, player.nodes, move, t))
+        print('Position {}: {}'.format(i + 1, '; '.join(row)))
+    for name, (nodes, t) in totals.items():
+        print('{}: {} nodes in total, {:.2f}s'.format(name, nodes, t))
+
+
 ################################ MAIN PROGRAM #################################
 
 if __name__ == '__main__':
@@ -123,6 +693,23 @@ if __name__ == '__main__':
     # Play single game
     # Reversi().play([RandomPlayer(), MyPlayer()], can_break_limit=[False, False], show_moves=show_moves)
     
+    # Compare number of searched nodes with different search settings on fixed positions
+    # node_count_report(Reversi(bitboard=True), random_positions(Reversi(bitboard=True), 10, 20),
+    #                   {'plain': MyPlayer(depth=4, tt_size=0, ordering=False),
+    #                    'ordering': MyPlayer(depth=4), 'pvs': MyPlayer(depth=4, pvs=True)})
+
+    # Speedup of parallel search
+    # parallel_speedup_report(Reversi(bitboard=True), random_positions(Reversi(bitboard=True), 10, 20), 4)
+
     # Play N games
     Reversi().play_n_games([MyPlayer(), MyPlayer()], n=10, can_break_limit=[False, True])
 
+    # Play with opening book (build it first by running opening_book.py)
+    # Reversi(bitboard=True).play([MyPlayer(book='opening_book.bin'), RandomPlayer()], show_moves=show_moves)
+
+    # Play with learned pattern evaluation (train it first by running patterns.py)
+    # Reversi(bitboard=True).play([MyPlayer(depth=2, evaluation='patterns.npz'), MyPlayer(depth=3)], show_moves=show_moves)
+
+    # Play N games in parallel processes
+    # print(Reversi(bitboard=True).play_tournament([MyPlayer(), RandomPlayer()], n=100, seed=0))
+
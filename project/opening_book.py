@@ -0,0 +1,172 @@
+import os
+import sys
+import mmap
+import struct
+from time import time
+from games import Reversi
+
+
+# File format: header (magic, board size k, number of records) followed by records sorted by
+# (black mask, white mask, player at turn). Each record is canonical position (see Symmetries)
+# and the best move in it, in coordinates of the canonical position.
+HEADER = struct.Struct('<4sBI')
+RECORD = struct.Struct('<QQBB')
+MAGIC = b'RVBK'
+
+
+class Symmetries:
+    # The 8 symmetries of k x k board (rotations and reflections) as permutations of tiles.
+    # Masks are transformed byte by byte using precomputed tables, so transforming a position
+    # is a few table lookups instead of a loop over all discs.
+    def __init__(self, k):
+        self.k = k
+        self.perms = []
+        for transpose in (False, True):
+            for flip_r in (False, True):
+                for flip_c in (False, True):
+                    perm = []
+                    for n in range(k * k):
+                        r, c = divmod(n, k)
+                        if transpose:
+                            r, c = c, r
+                        if flip_r:
+                            r = k - 1 - r
+                        if flip_c:
+                            c = k - 1 - c
+                        perm.append(r * k + c)
+                    self.perms.append(perm)
+        self.inverse = []
+        for perm in self.perms:
+            inv = [0] * (k * k)
+            for n, m in enumerate(perm):
+                inv[m] = n
+            self.inverse.append(inv)
+        # tables[s][i][byte] = transformed mask of bits byte << 8*i under symmetry s
+        self.tables = []
+        for perm in self.perms:
+            tables = []
+            for i in range((k * k + 7) // 8):
+                table = []
+                for byte in range(256):
+                    mask = 0
+                    for b in range(8):
+                        n = 8 * i + b
+                        if byte >> b & 1 and n < k * k:
+                            mask |= 1 << perm[n]
+                    table.append(mask)
+                tables.append(table)
+            self.tables.append(tables)
+
+    def transform(self, s, mask):
+        # mask transformed by symmetry s
+        result = 0
+        for table in self.tables[s]:
+            result |= table[mask & 255]
+            mask >>= 8
+        return result
+
+    def canonical(self, black, white):
+        # (canonical black, canonical white, symmetry) - canonical position is the smallest of
+        # all 8 transformed positions
+        best = None
+        for s in range(len(self.perms)):
+            key = (self.transform(s, black), self.transform(s, white), s)
+            if best is None or key < best:
+                best = key
+        return best
+
+
+class OpeningBook:
+    # Opening book stored in file created by build_book. File is memory-mapped and searched by
+    # binary search, so loading is instant and lookup costs a few microseconds.
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.k, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not an opening book'.format(path))
+        self.symmetries = Symmetries(self.k)
+
+    def __getstate__(self):
+        # memory map can`t be pickled, it is opened again from path
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def record(self, i):
+        return RECORD.unpack_from(self.data, HEADER.size + i * RECORD.size)
+
+    def find(self, black, white, side):
+        # move stored for canonical position, or None
+        lo, hi = 0, self.count
+        key = (black, white, side)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self.record(mid)
+            if record[:3] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            record = self.record(lo)
+            if record[:3] == key:
+                return record[3]
+        return None
+
+    def lookup(self, game, state):
+        # Book move for state of game, or None if state is not in the book
+        if game.k != self.k:
+            return None
+        players = game.players()
+        black, white = game.disc_masks(state, players[0])
+        black, white, s = self.symmetries.canonical(black, white)
+        move = self.find(black, white, players.index(game.player_at_turn(state)))
+        if move is None:
+            return None
+        return self.symmetries.inverse[s][move]
+
+
+def build_book(game, player, plies, path):
+    # Build opening book: every position reachable in at most plies moves from the initial state
+    # (positions equal up to symmetry only once) gets move chosen by player (e.g. deep MyPlayer).
+    assert game.k <= 8, 'book records hold 64-bit masks'
+    symmetries = Symmetries(game.k)
+    players = game.players()
+    book = {}
+    level = [game.initial_state()]
+    for ply in range(plies):
+        t = time()
+        next_level = []
+        for state in level:
+            if game.is_terminal(state):
+                continue
+            black, white = game.disc_masks(state, players[0])
+            black, white, s = symmetries.canonical(black, white)
+            key = (black, white, players.index(game.player_at_turn(state)))
+            if key in book:
+                continue
+            move = player.choose_move(game, state)
+            book[key] = symmetries.perms[s][move]
+            next_level.extend(game.state_after_move(state, a) for a in game.actions(state))
+        print('ply {}: {} positions in book ({:.1f}s)'.format(ply, len(book), time() - t))
+        level = next_level
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, game.k, len(book)))
+        for key in sorted(book):
+            f.write(RECORD.pack(*key, book[key]))
+
+
+if __name__ == '__main__':
+    # Build book: python opening_book.py [plies] [search depth] [file]
+    from minimax import MyPlayer
+    plies = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    path = sys.argv[3] if len(sys.argv) > 3 else 'opening_book.bin'
+    build_book(Reversi(bitboard=True), MyPlayer(depth=depth), plies, path)
+    print('Saved to {} ({} bytes)'.format(path, os.path.getsize(path)))
@@ -0,0 +1,183 @@
+import io
+import sys
+import random
+from contextlib import redirect_stdout
+import numpy as np
+from games import Reversi, popcount
+
+
+def pattern_instances(k):
+    # Patterns used by the evaluation: pattern name -> list of its instances on k x k board. All
+    # instances of one pattern are symmetric to each other (tiles listed in matching order, from
+    # the corner outwards) and share one table of values.
+    n = lambda r, c: r * k + c
+    last = k - 1
+    return {
+        'edge': [[n(0, c) for c in range(k)],
+                 [n(last, c) for c in range(k)],
+                 [n(r, 0) for r in range(k)],
+                 [n(r, last) for r in range(k)]],
+        'corner': [[n(r, c) for r in range(3) for c in range(3)],
+                   [n(r, last - c) for r in range(3) for c in range(3)],
+                   [n(last - r, c) for r in range(3) for c in range(3)],
+                   [n(last - r, last - c) for r in range(3) for c in range(3)]],
+        'diagonal': [[n(i, i) for i in range(k)],
+                     [n(i, last - i) for i in range(k)]],
+    }
+
+
+class Patterns:
+    # Computes base-3 codes of all pattern instances for given occupancy masks: tile i of an
+    # instance adds 3**i if own disc is there and 2 * 3**i if opponent`s disc is there. Codes are
+    # summed from per-byte tables (byte of mask -> its contribution to the code).
+    def __init__(self, k):
+        self.k = k
+        self.instances = pattern_instances(k)
+        self.names = list(self.instances)
+        self.sizes = {name: 3 ** len(inst[0]) for name, inst in self.instances.items()}
+        self.chunks = []  # for every instance: (name, [(shift, table), ...])
+        for name, instances in self.instances.items():
+            for tiles in instances:
+                position = {tile: 3 ** i for i, tile in enumerate(tiles)}
+                chunks = []
+                for shift in range(0, k * k, 8):
+                    if not any(shift <= tile < shift + 8 for tile in tiles):
+                        continue
+                    table = [sum(position.get(shift + b, 0) for b in range(8) if byte >> b & 1)
+                             for byte in range(256)]
+                    chunks.append((shift, table))
+                self.chunks.append((name, chunks))
+
+    def codes(self, own, opp):
+        # list of (pattern name, code) for every instance
+        result = []
+        for name, chunks in self.chunks:
+            code = 0
+            for shift, table in chunks:
+                code += table[(own >> shift) & 255] + 2 * table[(opp >> shift) & 255]
+            result.append((name, code))
+        return result
+
+
+class PatternEvaluation:
+    # Learned evaluation - sum of values of all pattern instances (looked up in pattern tables by
+    # code) and a bias. Value estimates final disc difference of the player at turn. The game is
+    # split into stages by number of discs on the board, every stage has its own tables.
+    def __init__(self, path=None, k=8, stages=1):
+        self.path = path
+        if path is None:
+            self.patterns = Patterns(k)
+            self.stages = stages
+            self.tables = {name: [[0.0] * size for _ in range(stages)]
+                           for name, size in self.patterns.sizes.items()}
+            self.bias = [0.0] * stages
+        else:
+            data = np.load(path)
+            self.patterns = Patterns(int(data['k']))
+            self.tables = {name: data[name].tolist() for name in self.patterns.names}
+            self.bias = data['bias'].tolist()
+            self.stages = len(self.bias)
+
+    def stage(self, own, opp):
+        k = self.patterns.k
+        return (popcount(own | opp) - 4) * self.stages // (k * k - 3)
+
+    def __call__(self, own, opp):
+        stage = self.stage(own, opp)
+        value = self.bias[stage]
+        for name, code in self.patterns.codes(own, opp):
+            value += self.tables[name][stage][code]
+        return value
+
+    def save(self, path):
+        arrays = {name: np.array(tables) for name, tables in self.tables.items()}
+        np.savez(path, k=self.patterns.k, bias=np.array(self.bias), **arrays)
+
+    def fit(self, positions, targets, epochs=200, regularization=10.0):
+        # Least-squares fit of tables to positions (list of (own, opp) masks of player at turn)
+        # and targets (final disc difference of that player), stage by stage. Every step moves
+        # each table entry by its average error over positions where it occurs (entries that
+        # never occur stay 0). Returns root mean square error over all positions.
+        names = self.patterns.names
+        offsets, total = {}, 0
+        for name in names:
+            offsets[name] = total
+            total += self.patterns.sizes[name]
+        stages = np.array([self.stage(own, opp) for own, opp in positions])
+        features = np.array([[offsets[name] + code for name, code in self.patterns.codes(own, opp)]
+                             for own, opp in positions], dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.float64)
+        squared_error = 0.0
+        for stage in range(self.stages):
+            f, y = features[stages == stage], targets[stages == stage]
+            if len(y) == 0:
+                continue
+            weights = np.zeros(total)
+            bias = y.mean()
+            counts = np.bincount(f.ravel(), minlength=total) + regularization
+            for _ in range(epochs):
+                error = weights[f].sum(axis=1) + bias - y
+                weights -= np.bincount(f.ravel(), np.repeat(error, f.shape[1]),
+                                       minlength=total) / counts / f.shape[1]
+                bias -= error.mean()
+            self.bias[stage] = float(bias)
+            for name in names:
+                self.tables[name][stage] = \
+                    weights[offsets[name]:offsets[name] + self.patterns.sizes[name]].tolist()
+            squared_error += ((weights[f].sum(axis=1) + bias - y) ** 2).sum()
+        return float(np.sqrt(squared_error / len(targets)))
+
+
+class RecordingPlayer:
+    # Wraps a player and records every state in which it chose a move (and the move) into history,
+    # shared by both players of a self-play game. First random_plies moves of the game are
+    # random, so self-play games don`t repeat.
+    def __init__(self, player, history, random_plies=8, rnd=random):
+        self.player = player
+        self.history = history
+        self.random_plies = random_plies
+        self.rnd = rnd
+
+    def choose_move(self, game, state):
+        if len(self.history) < self.random_plies:
+            move = self.rnd.choice(game.actions(state))
+        else:
+            move = self.player.choose_move(game, state)
+        self.history.append((state, move))
+        return move
+
+
+def self_play_positions(game, players, n_games, random_plies=8, seed=0):
+    # Play n_games games by Game.play and return (positions, targets): masks (own, opp) of player
+    # at turn in every position of the games and final disc difference of that player
+    rnd = random.Random(seed)
+    positions, targets = [], []
+    for i in range(n_games):
+        history = []
+        recorders = [RecordingPlayer(p, history, random_plies, rnd) for p in players]
+        with redirect_stdout(io.StringIO()):
+            game.play(recorders if i % 2 == 0 else recorders[::-1], show_moves=False)
+        last_state, last_move = history[-1]
+        final = game.state_after_move(last_state, last_move)
+        black, white = game.disc_masks(final, game.players()[0])
+        diff = popcount(black) - popcount(white)
+        for state, _ in history:
+            player = game.player_at_turn(state)
+            own, opp = game.disc_masks(state, player)
+            positions.append((own, opp))
+            targets.append(diff if player == game.players()[0] else -diff)
+    return positions, targets
+
+
+if __name__ == '__main__':
+    # Train pattern evaluation by self-play: python patterns.py [games] [file]
+    from minimax import MyPlayer
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    path = sys.argv[2] if len(sys.argv) > 2 else 'patterns.npz'
+    game = Reversi(bitboard=True)
+    players = [MyPlayer(depth=1, endgame_empties=6), MyPlayer(depth=1, endgame_empties=6)]
+    positions, targets = self_play_positions(game, players, n_games)
+    evaluation = PatternEvaluation(k=game.k)
+    rmse = evaluation.fit(positions, targets)
+    evaluation.save(path)
+    print('{} positions, RMSE {:.2f} discs, saved to {}'.format(len(positions), rmse, path))